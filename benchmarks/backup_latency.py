@@ -0,0 +1,125 @@
+"""Request latency and durability lag of the backup, written in the request
+path ('sync') or by its writer thread ('write-behind'), for each fsync policy.
+
+Run from the repository root:
+
+    python -m benchmarks.backup_latency
+
+Scripted players play a market through 'Game.handle_request'. After each
+request, a watcher thread waits for its last save to be fsynced: the lag is
+the time between the save and the moment it became durable.
+"""
+
+import os
+import sys
+import time
+from threading import Thread
+from queue import Queue
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+def watch(backup, saves, lags):
+
+    while True:
+        save = saves.get()
+        if save is None:
+            break
+
+        version, saved = save
+        backup.wait_durable(version)
+        lags.append(time.perf_counter() - saved)
+
+
+def run(backup_parameters, n_turns):
+
+    cont = Controller(model=None)
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    cont.data.param["backup"] = dict(cont.data.param["backup"], **backup_parameters)
+    cont.new_session("latency", dict(cont.data.param, assignment=assignment))
+    session = cont.sessions["latency"]
+
+    latencies = []
+    lags = []
+    saves = Queue()
+
+    watcher = Thread(target=watch, args=(session.backup, saves, lags))
+    watcher.start()
+
+    def send(path):
+        begin = time.perf_counter()
+        reply = session.game.handle_request(path)
+        latencies.append(time.perf_counter() - begin)
+        saves.put((session.backup.seq, time.perf_counter()))
+        return reply
+
+    players = ScriptedPlayers(send, android_ids)
+    players.init()
+
+    for _ in range(n_turns):
+        players.play_turn()
+
+    saves.put(None)
+    watcher.join()
+
+    session.close()
+    cont.server.end()
+
+    for file in session.backup.files:
+        os.remove(file)
+
+    latencies.sort()
+    lags.sort()
+
+    return {
+        "p50 (ms)": 1000 * latencies[len(latencies) // 2],
+        "p99 (ms)": 1000 * latencies[int(len(latencies) * 0.99)],
+        "lag p99 (ms)": 1000 * lags[int(len(lags) * 0.99)],
+        "lag max (ms)": 1000 * lags[-1]
+    }
+
+
+def main(n_turns=30):
+
+    ConfigFilesManager.run()
+
+    configurations = [
+        ("sync", {"write_behind": False, "fsync": "request"}),
+        ("write-behind", {"write_behind": True, "fsync": "request"}),
+        ("write-behind", {"write_behind": True, "fsync": "turn"}),
+        ("write-behind", {"write_behind": True, "fsync": "interval", "fsync_interval": 50})
+    ]
+
+    results = []
+    stdout = sys.stdout
+
+    for mode, backup_parameters in configurations:
+
+        # every request is logged
+        sys.stdout = open(os.devnull, "w")
+        try:
+            results.append((mode, backup_parameters, run(backup_parameters, n_turns)))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print("{:<14}{:<16}{:>10}{:>10}{:>14}{:>14}".format(
+        "mode", "fsync", "p50 (ms)", "p99 (ms)", "lag p99 (ms)", "lag max (ms)"))
+
+    for mode, backup_parameters, r in results:
+
+        fsync = backup_parameters["fsync"]
+        if fsync == "interval":
+            fsync += " {} ms".format(backup_parameters["fsync_interval"])
+
+        print("{:<14}{:<16}{:>10.3f}{:>10.3f}{:>14.2f}{:>14.2f}".format(
+            mode, fsync, r["p50 (ms)"], r["p99 (ms)"], r["lag p99 (ms)"], r["lag max (ms)"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Requests per second through 'Game.handle_request', with the former eval
+dispatch ('before') and the command router ('after').
+
+Run from the repository root:
+
+    python -m benchmarks.command_dispatch
+
+A market is played by scripted players for a few turns, then the same
+requests are replayed: 'handle_request' is the whole path, backups included,
+'handle_command' is the dispatch and the game logic only, 'resolve' is the
+dispatch alone: from the request to the method and its arguments. Replayed requests
+are about past turns, so they do not change the game.
+"""
+
+import os
+import sys
+import time
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from hotelling_server.control.game import Game
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+class EvalGame(Game):
+    """'Game' with the dispatch it had before the command router"""
+
+    def handle_command(self, request):
+
+        whole = [i for i in request.split("/") if i != ""]
+
+        command = eval("self.{}".format(whole[0]))
+
+        args = [int(a) if a.isdigit() else a for a in whole[1:]]
+
+        if not self.data.current_state["init_done"] and command != self.ask_init:
+            return "error/wait_init"
+
+        else:
+            return command(whole[0], *args)
+
+
+def eval_resolve(game, request):
+    """what 'EvalGame' does before running a command"""
+
+    whole = [i for i in request.split("/") if i != ""]
+    return eval("game.{}".format(whole[0])), [int(a) if a.isdigit() else a for a in whole[1:]]
+
+
+def router_resolve(game, request):
+    """what 'Game' does before running a command"""
+
+    whole = [i for i in request.split("/") if i != ""]
+    return game.command_router.resolve(whole[0], whole[1:])
+
+
+def play(game_class, n_turns):
+    """a session played for 'n_turns', returns its game and the requests of its last turn"""
+
+    cont = Controller(model=None)
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    cont.new_session("dispatch", dict(cont.data.param, assignment=assignment))
+    session = cont.sessions["dispatch"]
+    session.game.__class__ = game_class
+
+    requests = []
+
+    def send(path):
+        requests.append(path)
+        return session.game.handle_request(path)
+
+    players = ScriptedPlayers(send, android_ids)
+    players.init()
+
+    for _ in range(n_turns):
+        del requests[:]
+        players.play_turn()
+
+    cont.server.end()
+
+    return session, list(requests)
+
+
+def measure(method, requests, n_repeats):
+
+    begin = time.perf_counter()
+
+    for _ in range(n_repeats):
+        for request in requests:
+            method(request)
+
+    return n_repeats * len(requests) / (time.perf_counter() - begin)
+
+
+def main(n_turns=3, n_repeats=(20, 200, 20000)):
+
+    ConfigFilesManager.run()
+
+    results = {}
+    stdout = sys.stdout
+
+    # every request is logged
+    sys.stdout = open(os.devnull, "w")
+
+    try:
+        for name, game_class, resolve in (("before", EvalGame, eval_resolve), ("after", Game, router_resolve)):
+
+            session, requests = play(game_class, n_turns)
+
+            results[name] = (
+                measure(session.game.handle_request, requests, n_repeats[0]),
+                measure(session.game.handle_command, requests, n_repeats[1]),
+                measure(lambda request: resolve(session.game, request), requests, n_repeats[2])
+            )
+
+            session.close()
+            for file in session.backup.files:
+                os.remove(file)
+
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print("{:<10}{:>20}{:>20}{:>14}".format("dispatch", "handle_request/s", "handle_command/s", "resolve/s"))
+
+    for name, (whole, command, resolve) in results.items():
+        print("{:<10}{:>20.0f}{:>20.0f}{:>14.0f}".format(name, whole, command, resolve))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Per-request overhead of the server -> controller -> server round trip.
+
+Run from the repository root:
+
+    python -m benchmarks.dispatch_overhead
+
+'queues' is the former path: the request and its reply both go through a
+'multiprocessing.Queue' (pickled, sent through a pipe by a feeder thread) and
+the reply comes back on the single shared server queue. 'future' is the
+current path: an in-process queue carries the request together with its own
+'Future', completed directly by the controller thread.
+"""
+
+import multiprocessing
+import queue
+import time
+from concurrent.futures import Future
+from threading import Thread
+
+
+request = "/ask_customer_choice_recording/12/42/3/1"
+reply = "reply/reply_customer_choice_recording/42/0"
+
+
+def queues_controller(controller_queue, server_queue):
+
+    while True:
+        msg = controller_queue.get()
+        if msg[0] == "break":
+            break
+        server_queue.put(("reply", reply))
+
+
+def future_controller(controller_queue):
+
+    while True:
+        msg = controller_queue.get()
+        if msg[0] == "break":
+            break
+        msg[2].set_result(reply)
+
+
+def run_queues(n):
+
+    controller_queue = multiprocessing.Queue()
+    server_queue = multiprocessing.Queue()
+
+    controller = Thread(target=queues_controller, args=(controller_queue, server_queue))
+    controller.start()
+
+    begin = time.perf_counter()
+
+    for i in range(n):
+        controller_queue.put(("server_request", request))
+        server_queue.get()
+
+    elapsed = time.perf_counter() - begin
+
+    controller_queue.put(("break", ))
+    controller.join()
+
+    return elapsed / n
+
+
+def run_future(n):
+
+    controller_queue = queue.Queue()
+
+    controller = Thread(target=future_controller, args=(controller_queue, ))
+    controller.start()
+
+    begin = time.perf_counter()
+
+    for i in range(n):
+        f = Future()
+        controller_queue.put(("server_request", request, f))
+        f.result()
+
+    elapsed = time.perf_counter() - begin
+
+    controller_queue.put(("break", ))
+    controller.join()
+
+    return elapsed / n
+
+
+def main(n=20000):
+
+    for name, func in (("queues", run_queues), ("future", run_future)):
+        print("{:<8}{:>10.1f} us/request".format(name, 1e6 * func(n)))
+
+
+if __name__ == "__main__":
+    main()
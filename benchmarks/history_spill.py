@@ -0,0 +1,95 @@
+"""Resident memory of a long game history, kept in memory or spilled to
+memory-mapped files ('spill_history' in backup.json).
+
+Run from the repository root:
+
+    python -m benchmarks.history_spill [n_turns] [n_customers]
+
+Each configuration records the rows of 'n_turns' turns, as
+'Data.update_history' does, in a process of its own. Resident memory is read
+from /proc (Linux) as turns go by, then past turns are read at random, as
+the 't < time_manager.t' branches of 'Game' do.
+"""
+
+import os
+import shutil
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from hotelling_server.control.history import History
+from hotelling_server.control.state import State
+
+
+def resident_memory():
+    """in MB"""
+
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def run(args):
+
+    folder, n_turns, n_customers = args
+
+    state = State(2, n_customers)
+    history = History({key: State.value_dtype(key) for key in state}, folder=folder)
+
+    rng = np.random.RandomState(0)
+    state["customer_firm_choices"] = rng.randint(-1, 2, n_customers)
+    state["customer_extra_view_choices"] = rng.randint(0, 11, n_customers)
+    state["customer_states"] = ["ask_customer_choice_recording"] * n_customers
+    state["time_since_last_request_customers"] = [str(i) for i in rng.randint(0, 60, n_customers)]
+
+    start = resident_memory()
+    memory = []
+    checkpoints = {n_turns * (i + 1) // 4 for i in range(4)}
+
+    begin = time.perf_counter()
+
+    for t in range(n_turns):
+
+        state["customer_utility"] = rng.randint(0, 20, n_customers)
+        history.append({key: state[key] for key in state})
+
+        if t + 1 in checkpoints:
+            memory.append(resident_memory() - start)
+
+    append_time = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+
+    for t in rng.randint(0, n_turns, 1000):
+        int(np.sum(history["customer_firm_choices"][t] == 0))
+
+    read_time = time.perf_counter() - begin
+
+    return memory, 1000 * append_time / n_turns, 1000 * read_time / 1000
+
+
+def main(n_turns=20000, n_customers=100):
+
+    folder = os.getcwd() + "/results/history_spill_benchmark"
+
+    print("{} turns, {} customers".format(n_turns, n_customers))
+    print("{:<10}{:>40}{:>14}{:>12}".format(
+        "history", "resident memory at 1/4..4/4 (MB)", "append (ms)", "read (ms)"))
+
+    try:
+        for name, spill_folder in (("memory", None), ("spilled", folder)):
+
+            # A process each: the memory of one is not left to the next
+            with Pool(1) as pool:
+                memory, append_time, read_time = pool.apply(run, ((spill_folder, n_turns, n_customers), ))
+
+            print("{:<10}{:>40}{:>14.3f}{:>12.3f}".format(
+                name, " ".join("{:.0f}".format(m) for m in memory), append_time, read_time))
+
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
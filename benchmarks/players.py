@@ -0,0 +1,86 @@
+"""Scripted players for benchmarks: every seat of a market is played by
+sending the requests a phone would send, without any network.
+
+'send' is called with a request path ('/ask_init/<android_id>', ...) and
+returns the game reply. Players follow the rules of 'Game', so a turn is
+always completed in the same number of requests.
+"""
+
+import json
+
+import numpy as np
+
+
+def human_assignment(n_firms, n_customers):
+    """(assignment, android ids): every seat is held by a known phone, none by a bot"""
+
+    with open("hotelling_server/parameters/map_android_id_server_id.json") as f:
+        mapping = json.load(f)
+
+    android_ids = sorted(mapping, key=mapping.get)[:n_firms + n_customers]
+
+    assignment = [[str(mapping[i]), "firm" if n < n_firms else "customer", False]
+                  for n, i in enumerate(android_ids)]
+
+    return assignment, android_ids
+
+
+class ScriptedPlayers:
+
+    def __init__(self, send, android_ids, n_positions=11, n_prices=11, seed=0):
+
+        self.send = send
+        self.android_ids = android_ids
+        self.n_positions = n_positions
+        self.n_prices = n_prices
+        self.random = np.random.RandomState(seed)
+
+        self.firms = {}  # key: game_id, value: 'active' or 'passive'
+        self.customers = []  # game ids
+
+        self.t = 0
+        self.n_requests = 0
+
+    def ask(self, *args):
+
+        self.n_requests += 1
+        reply = self.send("/" + "/".join(str(a) for a in args))
+
+        if not str(reply).startswith("reply/"):
+            raise RuntimeError("Unexpected reply to {}: '{}'.".format(args, reply))
+
+        return reply.split("/")
+
+    def init(self):
+
+        for android_id in self.android_ids:
+
+            reply = self.ask("ask_init", android_id)
+            game_id, role = int(reply[2]), reply[4]
+
+            if role == "firm":
+                self.firms[game_id] = reply[6]
+            else:
+                self.customers.append(game_id)
+
+    def play_turn(self):
+
+        t = self.t
+        active = [i for i, status in self.firms.items() if status == "active"][0]
+        passive = [i for i, status in self.firms.items() if status == "passive"][0]
+
+        self.ask("ask_firm_active_choice_recording", active, t,
+                 self.random.randint(1, self.n_positions), self.random.randint(1, self.n_prices))
+
+        self.ask("ask_firm_passive_opponent_choice", passive, t)
+
+        for game_id in self.customers:
+            self.ask("ask_customer_firm_choices", game_id, t)
+            self.ask("ask_customer_choice_recording", game_id, t,
+                     self.random.randint(self.n_positions), self.random.randint(2))
+
+        self.ask("ask_firm_active_customer_choices", active, t)
+        self.ask("ask_firm_passive_customer_choices", passive, t)
+
+        self.firms[active], self.firms[passive] = "passive", "active"
+        self.t += 1
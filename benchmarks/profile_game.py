@@ -0,0 +1,80 @@
+"""Profile of a whole game played by scripted players.
+
+Run from the repository root:
+
+    python -m benchmarks.profile_game [n_turns]
+
+Requests go straight to 'Game.handle_request' (no network, no controller
+queue), under 'cProfile'. Prints the time per request and the functions
+taking the most time, own time and callees included.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import time
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+def play(n_turns):
+
+    cont = Controller(model=None)
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    cont.new_session("profile", dict(cont.data.param, assignment=assignment))
+    session = cont.sessions["profile"]
+
+    players = ScriptedPlayers(session.game.handle_request, android_ids)
+
+    profile = cProfile.Profile()
+    begin = time.perf_counter()
+
+    profile.enable()
+
+    players.init()
+    for _ in range(n_turns):
+        players.play_turn()
+
+    profile.disable()
+
+    elapsed = time.perf_counter() - begin
+
+    cont.server.end()
+    session.close()
+    for file in session.backup.files:
+        os.remove(file)
+
+    return profile, elapsed, players.n_requests
+
+
+def main(n_turns=100, n_functions=15):
+
+    ConfigFilesManager.run()
+
+    stdout = sys.stdout
+
+    # every request is logged
+    sys.stdout = open(os.devnull, "w")
+    try:
+        profile, elapsed, n_requests = play(n_turns)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print("{} turns, {} requests in {:.2f} s: {:.2f} ms/request (profiled)".format(
+        n_turns, n_requests, elapsed, 1000 * elapsed / n_requests))
+
+    report = io.StringIO()
+    pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(n_functions)
+    print(report.getvalue())
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,158 @@
+"""Time to resume a long game after a crash, for several snapshot intervals
+('snapshot_every' in backup.json).
+
+Run from the repository root:
+
+    python -m benchmarks.recovery [n_turns]
+
+A market is played by scripted players for 'n_turns' turns, each save going
+to one backup per snapshot interval. The last journal record of each backup
+is then cut short, as by a crash in the middle of a write, and the game is
+resumed from each backup with 'Controller.load_session'. The same is done
+after damaging the last snapshot, which makes the recovery start from the
+former one.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from hotelling_server.control.backup import Backup
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+def play(cont, intervals, n_turns):
+    """a session played for 'n_turns', saved by one backup per snapshot interval"""
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    cont.new_session("recovery", dict(cont.data.param, assignment=assignment))
+    session = cont.sessions["recovery"]
+
+    backups = {}
+
+    for snapshot_every in intervals:
+        backups[snapshot_every] = Backup(controller=session)
+        backups[snapshot_every].snapshot_every = snapshot_every
+
+    # Every save of the session also goes to these backups
+    write = session.backup.write
+
+    def write_all(saved):
+        for backup in backups.values():
+            backup.write(saved)
+        return write(saved)
+
+    session.backup.write = write_all
+
+    players = ScriptedPlayers(session.game.handle_request, android_ids)
+    players.init()
+
+    for _ in range(n_turns):
+        players.play_turn()
+
+    # Last save, the one the crash cuts
+    session.data.current_state["time_since_last_request_firms"][0] = "1"
+    session.data.save()
+
+    for backup in backups.values():
+        backup.flush()
+
+    return session, backups
+
+
+def crash(backup):
+    """the last record of the journal is cut in the middle"""
+
+    with open(backup.journal_file, "rb+") as journal:
+        journal.seek(0, os.SEEK_END)
+        journal.truncate(max(len(Backup.journal_tag), journal.tell() - 10))
+
+
+def damage(backup):
+    """a byte of the last snapshot is changed"""
+
+    with open(backup.file, "rb+") as file:
+        file.seek(-100, os.SEEK_END)
+        byte = file.read(1)
+        file.seek(-1, os.SEEK_CUR)
+        file.write(bytes([byte[0] ^ 0xff]))
+
+
+def resume(cont, backup, session):
+    """time to load the session from the backup, and whether it is where it was left"""
+
+    session_id = "resumed"
+
+    begin = time.perf_counter()
+    cont.load_session(session_id, backup.file)
+    elapsed = time.perf_counter() - begin
+
+    resumed = cont.sessions.pop(session_id)
+    resumed.close()
+
+    # Only the last save is lost
+    same = resumed.time_manager.t == session.time_manager.t and \
+        resumed.time_manager.state == session.time_manager.state and \
+        len(resumed.data.history) == len(session.data.history) and \
+        np.array_equal(resumed.data.history["firm_prices"], session.data.history["firm_prices"])
+
+    return elapsed, same
+
+
+def main(n_turns=10000, intervals=(100, 1000, 10000, 10 ** 9)):
+
+    ConfigFilesManager.run()
+
+    stdout = sys.stdout
+    results = []
+
+    # every request is logged
+    sys.stdout = open(os.devnull, "w")
+
+    try:
+        cont = Controller(model=None)
+        session, backups = play(cont, intervals, n_turns)
+
+        for snapshot_every, backup in backups.items():
+
+            journal = os.path.getsize(backup.journal_file) / 1000
+            snapshot = os.path.getsize(backup.file) / 1000
+
+            crash(backup)
+            cut = resume(cont, backup, session)
+
+            damage(backup)
+            damaged = resume(cont, backup, session)
+
+            results.append((snapshot_every, snapshot, journal, cut, damaged))
+
+        cont.server.end()
+        session.live_state.close()
+
+        for backup in list(backups.values()) + [session.backup]:
+            backup.close()
+            for file in backup.files:
+                os.remove(file)
+
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print("{} turns".format(n_turns))
+    print("{:<16}{:>16}{:>14}{:>20}{:>24}".format(
+        "snapshot_every", "snapshot (kB)", "journal (kB)", "resume (ms)", "damaged snapshot (ms)"))
+
+    for snapshot_every, snapshot, journal, cut, damaged in results:
+        print("{:<16}{:>16.0f}{:>14.0f}{:>14.1f}{:>6}{:>18.1f}{:>6}".format(
+            snapshot_every if snapshot_every < 10 ** 9 else "never", snapshot, journal,
+            1000 * cut[0], "ok" if cut[1] else "wrong", 1000 * damaged[0], "ok" if damaged[1] else "lost"))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,130 @@
+"""Time of a query across sessions, from the results database ('database' in
+backup.json) or from the backup files.
+
+Run from the repository root:
+
+    python -m benchmarks.results_database [n_sessions] [n_turns]
+
+'n_sessions' markets are played by scripted players for 'n_turns' turns,
+half of them with an exploration cost of 1 and half with 2, their backups
+also storing the results in a database. The mean price at turn
+'n_turns // 2' across the sessions with an exploration cost of 1 is then
+computed from the database, and by loading every backup.
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from hotelling_server.control.backup import Backup
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+database = "results/results_database_benchmark.db"
+
+query = """
+    SELECT AVG(price) FROM firm_choices JOIN sessions ON sessions.id = firm_choices.session
+    WHERE t = ? AND exploration_cost = ?
+"""
+
+
+def play(cont, n_sessions, n_turns):
+    """backups of the sessions played"""
+
+    cont.data.param["backup"] = dict(cont.data.param["backup"], database=database)
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    backups = []
+
+    for i in range(n_sessions):
+
+        parametrization = dict(cont.data.param["parametrization"], exploration_cost=1 + i % 2)
+        cont.new_session(str(i), dict(cont.data.param, assignment=assignment, parametrization=parametrization))
+        session = cont.sessions.pop(str(i))
+
+        players = ScriptedPlayers(session.game.handle_request, android_ids, seed=i)
+        players.init()
+
+        for _ in range(n_turns):
+            players.play_turn()
+
+        session.close()
+        backups.append(session.backup)
+
+    return backups
+
+
+def from_database(t, exploration_cost):
+
+    connection = sqlite3.connect(database)
+    mean = connection.execute(query, (t, exploration_cost)).fetchone()[0]
+    connection.close()
+
+    return mean
+
+
+def from_backups(backups, t, exploration_cost):
+
+    prices = []
+
+    for backup in backups:
+        data = Backup(controller=backup.controller).load(backup.file)
+
+        if data["parametrization"]["exploration_cost"] == exploration_cost:
+            prices.extend(data["history"]["firm_prices"][t])
+
+    return np.mean(prices)
+
+
+def main(n_sessions=40, n_turns=200):
+
+    ConfigFilesManager.run()
+
+    stdout = sys.stdout
+
+    # every request is logged
+    sys.stdout = open(os.devnull, "w")
+
+    try:
+        cont = Controller(model=None)
+        backups = play(cont, n_sessions, n_turns)
+
+        t = n_turns // 2
+        results = []
+
+        for name, compute in (("database", from_database), ("backups", lambda *a: from_backups(backups, *a))):
+
+            begin = time.perf_counter()
+            mean = compute(t, 1)
+            results.append((name, 1000 * (time.perf_counter() - begin), mean))
+
+        cont.server.end()
+
+        for backup in backups:
+            for file in backup.files:
+                os.remove(file)
+
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+        for file in (database, database + "-wal", database + "-shm"):
+            if os.path.exists(file):
+                os.remove(file)
+
+    print("{} sessions, {} turns: mean price at t = {}, exploration cost 1".format(n_sessions, n_turns, t))
+    print("{:<10}{:>12}{:>10}".format("from", "time (ms)", "mean"))
+
+    for name, elapsed, mean in results:
+        print("{:<10}{:>12.1f}{:>10.3f}".format(name, elapsed, mean))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
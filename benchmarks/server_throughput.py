@@ -0,0 +1,161 @@
+"""Throughput comparison of the server front-ends ('tcp' vs 'asyncio').
+
+Run from the repository root:
+
+    python -m benchmarks.server_throughput
+
+Each run starts a 'Server' fed by an echo controller, then 'n_clients' threads
+send requests in a loop while 'n_slow_clients' dribble their request line byte
+per byte, as a phone on a bad Wi-Fi link would.
+"""
+
+import http.client
+import os
+import socket
+import sys
+import time
+from queue import Queue
+from threading import Thread, Event
+
+from hotelling_server.control.server import Server
+
+
+class EchoController(Thread):
+    """stands for 'Controller': replies to every request without any game logic"""
+
+    def __init__(self, front_end, port):
+        super().__init__(daemon=True)
+        self.queue = Queue()
+        self.parameters = {"network": {"local": True, "port": port, "front_end": front_end}}
+        self.server = Server(controller=self)
+        self.running = Event()
+
+    def get_parameters(self, key):
+        return self.parameters[key]
+
+    def run(self):
+
+        while True:
+            msg = self.queue.get()
+
+            if msg[0] == "server_running":
+                self.running.set()
+
+            elif msg[0] == "server_request":
+                msg[2].set_result("reply/reply_echo{}".format(msg[1]))
+
+            elif msg[0] == "break":
+                break
+
+
+def client(port, n_requests, timeout, latencies, errors):
+
+    connection = http.client.HTTPConnection("localhost", port, timeout=timeout)
+
+    for i in range(n_requests):
+        begin = time.perf_counter()
+        try:
+            connection.request("GET", "/ask_echo/{}".format(i))
+            connection.getresponse().read()
+            latencies.append(time.perf_counter() - begin)
+
+        # a blocked front-end leaves the client hanging
+        except OSError:
+            errors.append(i)
+            connection.close()
+
+    connection.close()
+
+
+def slow_client(port, duration, stop_event):
+
+    request = b"GET /ask_echo/slow HTTP/1.0\r\n\r\n"
+
+    while not stop_event.is_set():
+        try:
+            sock = socket.create_connection(("localhost", port))
+            for byte in request:
+                sock.send(bytes([byte]))
+                Event().wait(duration / len(request))
+            sock.recv(1024)
+            sock.close()
+
+        # the server went down at the end of the run
+        except OSError:
+            break
+
+
+def run(front_end, port, n_clients, n_requests, n_slow_clients, slow_duration, timeout):
+
+    cont = EchoController(front_end=front_end, port=port)
+    cont.start()
+    cont.server.start()
+    cont.server.queue.put(("Go", ))
+    cont.running.wait()
+
+    stop_event = Event()
+    latencies = []
+    errors = []
+
+    slow = [Thread(target=slow_client, args=(port, slow_duration, stop_event), daemon=True)
+            for _ in range(n_slow_clients)]
+    fast = [Thread(target=client, args=(port, n_requests, timeout, latencies, errors)) for _ in range(n_clients)]
+
+    for t in slow:
+        t.start()
+
+    begin = time.perf_counter()
+
+    for t in fast:
+        t.start()
+    for t in fast:
+        t.join()
+
+    elapsed = time.perf_counter() - begin
+
+    stop_event.set()
+    cont.server.shutdown()
+    cont.server.end()
+    cont.queue.put(("break", ))
+
+    latencies.sort()
+
+    return {
+        "requests/s": len(latencies) / elapsed,
+        "p50 (ms)": 1000 * latencies[len(latencies) // 2],
+        "p99 (ms)": 1000 * latencies[int(len(latencies) * 0.99)],
+        "timeouts": len(errors)
+    }
+
+
+def main(n_clients=20, n_requests=50, n_slow_clients=2, slow_duration=0.5, timeout=5):
+
+    results = {}
+
+    stdout = sys.stdout
+
+    for port, front_end in enumerate(("tcp", "asyncio"), start=8091):
+        for n_slow in (0, n_slow_clients):
+
+            # servers log every request
+            sys.stdout = open(os.devnull, "w")
+            try:
+                results[front_end, n_slow] = run(front_end, port + 10 * n_slow, n_clients, n_requests,
+                                                 n_slow, slow_duration, timeout)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+    print("{} clients x {} requests, slow clients send one request every {} s".format(
+        n_clients, n_requests, slow_duration))
+
+    print("{:<10}{:>14}{:>14}{:>12}{:>12}{:>10}".format(
+        "front-end", "slow clients", "requests/s", "p50 (ms)", "p99 (ms)", "timeouts"))
+
+    for (front_end, n_slow), r in results.items():
+        print("{:<10}{:>14}{:>14.0f}{:>12.2f}{:>12.2f}{:>10}".format(
+            front_end, n_slow, r["requests/s"], r["p50 (ms)"], r["p99 (ms)"], r["timeouts"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Aggregate request rate of one server process hosting several sessions.
+
+Run from the repository root:
+
+    python -m benchmarks.session_scaling
+
+For each number of sessions, a 'Controller' hosts that many markets and one
+thread per session plays all of its seats with scripted players, through the
+same path as the front-ends ('Server.submit_request', then the controller
+queue). Each session writes its own backup files, removed at the end.
+"""
+
+import os
+import sys
+import time
+from threading import Thread
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from hotelling_server.control.session import session_prefix
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+def serve(cont):
+    """the message loop of 'Controller.run', without launching the default game"""
+
+    while True:
+        message = cont.queue.get()
+        if message[0] == "break":
+            break
+        cont.handle_message(message)
+
+
+def play(cont, session_id, android_ids, n_turns, counts):
+
+    def send(path):
+        return cont.server.submit_request(session_prefix + session_id + path).result()
+
+    players = ScriptedPlayers(send, android_ids, seed=int(session_id))
+    players.init()
+
+    for _ in range(n_turns):
+        players.play_turn()
+
+    counts.append(players.n_requests)
+
+
+def run(n_sessions, n_turns):
+
+    cont = Controller(model=None)
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    parameters = dict(cont.data.param, assignment=assignment)
+
+    for i in range(n_sessions):
+        cont.new_session(str(i), parameters)
+
+    controller = Thread(target=serve, args=(cont, ))
+    controller.start()
+
+    counts = []
+    players = [Thread(target=play, args=(cont, str(i), android_ids, n_turns, counts)) for i in range(n_sessions)]
+
+    begin = time.perf_counter()
+
+    for t in players:
+        t.start()
+    for t in players:
+        t.join()
+
+    elapsed = time.perf_counter() - begin
+
+    cont.queue.put(("break", ))
+    controller.join()
+    cont.server.end()
+
+    for session in cont.sessions.values():
+        session.close()
+        for file in session.backup.files:
+            os.remove(file)
+
+    return sum(counts) / elapsed, n_sessions * n_turns / elapsed
+
+
+def main(n_turns=20, session_counts=(1, 2, 4, 8)):
+
+    ConfigFilesManager.run()
+
+    results = {}
+    stdout = sys.stdout
+
+    for n_sessions in session_counts:
+
+        # every request is logged
+        sys.stdout = open(os.devnull, "w")
+        try:
+            results[n_sessions] = run(n_sessions, n_turns)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print("{} turns per session".format(n_turns))
+    print("{:<10}{:>14}{:>12}".format("sessions", "requests/s", "turns/s"))
+
+    for n_sessions, (requests, turns) in results.items():
+        print("{:<10}{:>14.0f}{:>12.1f}".format(n_sessions, requests, turns))
+
+
+if __name__ == "__main__":
+    main()
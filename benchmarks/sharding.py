@@ -0,0 +1,127 @@
+"""Turn throughput of sessions spread on worker processes by the router.
+
+Run from the repository root:
+
+    python -m benchmarks.sharding
+
+For each number of workers, a 'Router' starts that many 'Controller'
+processes, then one thread per session opens it ('/new_session') and plays
+all of its seats with scripted players over HTTP through the router. Backup
+files written by the workers are removed at the end.
+
+Gains are bounded by the number of cores: each worker is one process,
+playing sessions on one core at most.
+"""
+
+import glob
+import http.client
+import json
+import os
+import socket
+import sys
+import time
+from threading import Thread
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.control.router import Router
+from hotelling_server.control.session import session_prefix
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+def play(port, session_id, android_ids, n_turns, counts):
+
+    connection = http.client.HTTPConnection("localhost", port)
+
+    def send(path):
+        connection.request("GET", session_prefix + session_id + path)
+        return connection.getresponse().read().decode()
+
+    send("/new_session")
+
+    players = ScriptedPlayers(send, android_ids, seed=int(session_id))
+    players.init()
+
+    for _ in range(n_turns):
+        players.play_turn()
+
+    connection.close()
+    counts.append(players.n_requests)
+
+
+def run(port, n_workers, n_sessions, n_turns, android_ids):
+
+    router = Router(server_address=("localhost", port), n_workers=n_workers)
+    routing = Thread(target=router.run)
+    routing.start()
+
+    # ready once the router listens, its workers are started before
+    while True:
+        try:
+            socket.create_connection(("localhost", port)).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    counts = []
+    players = [Thread(target=play, args=(port, str(i), android_ids, n_turns, counts)) for i in range(n_sessions)]
+
+    begin = time.perf_counter()
+
+    for t in players:
+        t.start()
+    for t in players:
+        t.join()
+
+    elapsed = time.perf_counter() - begin
+
+    router.shutdown()
+    routing.join()
+
+    return sum(counts) / elapsed, n_sessions * n_turns / elapsed
+
+
+def main(n_sessions=8, n_turns=10, worker_counts=(1, 2, 4)):
+
+    ConfigFilesManager.run()
+
+    # sessions are opened with the assignment of the parameters file
+    assignment, android_ids = human_assignment(n_firms=2, n_customers=11)
+
+    with open("hotelling_server/parameters/assignment.json") as f:
+        former_assignment = f.read()
+
+    with open("hotelling_server/parameters/assignment.json", "w") as f:
+        json.dump(assignment, f)
+
+    former_results = set(glob.glob("results/xp_*"))
+
+    results = {}
+    stdout = sys.stdout
+
+    try:
+        for i, n_workers in enumerate(worker_counts):
+
+            # every request is logged
+            sys.stdout = open(os.devnull, "w")
+            try:
+                results[n_workers] = run(8300 + 10 * i, n_workers, n_sessions, n_turns, android_ids)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+    finally:
+        with open("hotelling_server/parameters/assignment.json", "w") as f:
+            f.write(former_assignment)
+
+        for file in set(glob.glob("results/xp_*")) - former_results:
+            os.remove(file)
+
+    print("{} sessions x {} turns, {} cores".format(n_sessions, n_turns, os.cpu_count()))
+    print("{:<10}{:>14}{:>12}".format("workers", "requests/s", "turns/s"))
+
+    for n_workers, (requests, turns) in results.items():
+        print("{:<10}{:>14.0f}{:>12.1f}".format(n_workers, requests, turns))
+
+
+if __name__ == "__main__":
+    main()
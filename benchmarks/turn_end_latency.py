@@ -0,0 +1,111 @@
+"""Latency of the requests ending a turn, with the figures of the game
+computed in the server process or in the statistics process.
+
+Run from the repository root:
+
+    python -m benchmarks.turn_end_latency [n_turns]
+
+A market is played by scripted players, each request timed. The request
+ending a turn is the slowest of the turn: with a 'Statistician' in the
+server process, it also computes the figures of the turn; with the
+'RemoteStatistician' of the session, it only sends its values. The time
+taken by the figures in that request is given apart: with a single CPU, the
+statistics process still takes it from the server right after.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from hotelling_server.parameters.config_files_manager import ConfigFilesManager
+from hotelling_server.controller import Controller
+from hotelling_server.control.statistician import Statistician
+from benchmarks.players import ScriptedPlayers, human_assignment
+
+
+def play(cont, session_id, local, n_turns):
+    """(latency of every request, latency of the slowest request of each turn, time taken by the
+    figures in the request ending each turn) in ms"""
+
+    game_parameters = cont.data.param["game"]
+    assignment, android_ids = human_assignment(game_parameters["n_firms"], game_parameters["n_customers"])
+
+    cont.new_session(session_id, dict(cont.data.param, assignment=assignment))
+    session = cont.sessions[session_id]
+
+    if local:
+        session.statistician = Statistician(controller=session)
+
+    latencies = []
+    figures = []
+
+    compute_figures = session.statistician.compute_figures
+
+    def timed_compute_figures():
+        begin = time.perf_counter()
+        compute_figures()
+        figures.append(1000 * (time.perf_counter() - begin))
+
+    session.statistician.compute_figures = timed_compute_figures
+
+    def send(path):
+        begin = time.perf_counter()
+        reply = session.game.handle_request(path)
+        latencies.append(1000 * (time.perf_counter() - begin))
+        return reply
+
+    players = ScriptedPlayers(send, android_ids)
+    players.init()
+
+    turn_ends = []
+
+    for _ in range(n_turns):
+        start = len(latencies)
+        players.play_turn()
+        turn_ends.append(max(latencies[start:]))
+
+    session.close()
+
+    for file in session.backup.files:
+        os.remove(file)
+
+    return latencies, turn_ends, figures
+
+
+def main(n_turns=500):
+
+    ConfigFilesManager.run()
+
+    stdout = sys.stdout
+    results = []
+
+    # every request is logged
+    sys.stdout = open(os.devnull, "w")
+
+    try:
+        cont = Controller(model=None)
+
+        for name, local in (("server process", True), ("statistics process", False)):
+            latencies, turn_ends, figures = play(cont, name.split()[0], local, n_turns)
+            results.append((
+                name, np.median(latencies), np.median(figures), np.median(turn_ends), np.percentile(turn_ends, 99)))
+
+        cont.server.end()
+        cont.statistics.close()
+
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    print("{} turns".format(n_turns))
+    print("{:<20}{:>16}{:>16}{:>22}{:>20}".format(
+        "figures in", "request (ms)", "figures (ms)", "turn end, p50 (ms)", "turn end, p99 (ms)"))
+
+    for name, request, figures, turn_end, turn_end_99 in results:
+        print("{:<20}{:>16.3f}{:>16.3f}{:>22.3f}{:>20.3f}".format(name, request, figures, turn_end, turn_end_99))
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -1,9 +1,10 @@
 import json
+import time
 from threading import Thread, Event
 from multiprocessing import Queue
 import numpy as np
 import requests
-from utils.utils import Logger, function_name, get_local_ip
+from utils.utils import Logger, CommandRouter, auto, function_name, get_local_ip
 
 
 class GenericBotClient(Thread, Logger):
@@ -22,6 +23,21 @@ class GenericBotClient(Thread, Logger):
     port = network_parameters["port"]
     delay_retry = 1
 
+    # Seconds the server may park a request that would get 'error/wait' (0: no long polling)
+    long_poll = network_parameters.get("long_poll", 0)
+
+    # Retry on server pushes rather than every 'delay_retry' seconds
+    subscribe = network_parameters.get("subscribe", False)
+
+    # Send a demand together with the one expected to follow it
+    batch = network_parameters.get("batch", False)
+    batch_separator = ";"
+
+    # Server replies and own messages handled, with the types of their arguments
+    commands = {
+        "ask_server": (str, )
+    }
+
     def __init__(self):
 
         super().__init__()
@@ -37,41 +53,132 @@ class GenericBotClient(Thread, Logger):
 
         self.queue = Queue()
 
+        # Set by the subscriber at each push from the server
+        self.state_changed = Event()
+        self.last_push = None
+
+        # Replies got in a batch, by demand
+        self.prefetched = {}
+
+        self.command_router = CommandRouter(self, self.commands)
+
+        if self.subscribe:
+            Thread(target=self.subscriber, daemon=True).start()
+
+    def subscriber(self):
+        """listen to server-sent events, reconnect if the stream ends"""
+
+        while self.continue_game:
+            try:
+                r = requests.get('http://{}:{}/subscribe'.format(self.ip_address, self.port), stream=True)
+
+                # Events are short: do not wait for a full buffer before handling one
+                for line in r.iter_lines(chunk_size=1, decode_unicode=True):
+                    if line and line.startswith("data: "):
+                        self.last_push = line[len("data: "):]
+                        self.log("Server pushed: '{}'.".format(self.last_push))
+                        self.state_changed.set()
+
+            except Exception as e:
+                self.log("I got trouble with subscription: '{}'.".format(e))
+
+            Event().wait(self.delay_retry)
+
+    def wait_before_retry(self, elapsed):
+
+        # A server parking requests already waited for us
+        if self.long_poll and elapsed >= self.long_poll * 0.9:
+            return
+
+        if self.subscribe:
+            # Pushes are the trigger, the delay is only a fallback if one gets lost
+            self.state_changed.wait(10 * self.delay_retry)
+
+        else:
+            Event().wait(self.delay_retry)
+
     def handle(self, what, params):
 
         self.log("Handle {} with params '{}'.".format(what, params))
 
-        params = [int(x) if type(x) == str and x.isdigit() else x for x in params]
-
-        command = eval("self.{}".format(what))
+        command, params = self.command_router.resolve(what, list(params))
         command(*params)
 
     def ask_server(self, message):
 
         self.server_demand = message
 
-        self.log("Ask the server: '{}'.".format(message))
+        # Already answered as part of a batch
+        if message in self.prefetched:
+            received = self.prefetched.pop(message)
+            self.log("Received from server in a previous batch: '{}'.".format(received))
+
+        else:
+            self.log("Ask the server: '{}'.".format(message))
+            received = self.get_reply(message)
+            self.log("Received from server: '{}'.".format(received))
+
+        parts = [i for i in received.split("/") if len(i)]
+        self.handle(what=parts[1], params=parts[2:])
+
+    def ask_server_batch(self, messages):
+        """ask several demands in one round trip. The first one is handled as by 'ask_server',
+        replies to the following ones are kept until they are asked"""
+
+        self.server_demand = messages[0]
+
+        self.log("Ask the server in a batch: '{}'.".format(messages))
+
+        replies = self.get_reply("batch/" + self.batch_separator.join(messages)).split("\n")
+
+        self.log("Received from server: '{}'.".format(replies))
+
+        for message, received in zip(messages[1:], replies[1:]):
+            if self.is_reply(received):
+                self.prefetched[message] = received
+
+        parts = [i for i in replies[0].split("/") if len(i)]
+        self.handle(what=parts[1], params=parts[2:])
+
+    def ask_server_then(self, message, next_message):
+        """'next_message' is the demand which follows 'message' at this point of a turn"""
+
+        if self.batch:
+            self.ask_server_batch([message, next_message])
+        else:
+            self.ask_server(message)
+
+    def get_reply(self, message):
+        """ask the server until the (first) reply is in good shape"""
+
+        url = 'http://{}:{}/{}'.format(self.ip_address, self.port, message)
+
+        if self.long_poll:
+            url += "?long_poll={}".format(self.long_poll)
 
         while True:
             try:
-                r = requests.get('http://{}:{}/{}'.format(self.ip_address, self.port, message))
+                begin = time.time()
+                self.state_changed.clear()
+                r = requests.get(url)
                 received = r.text
-                parts = [i for i in received.split("/") if len(i)]
 
-                if len(parts) > 1 and parts[0] == "reply":
-                    break
+                if self.is_reply(received.split("\n")[0]):
+                    return received
 
                 else:
                     self.log("Response in bad shape: '{}'.".format(received))
-                    Event().wait(self.delay_retry)
+                    self.wait_before_retry(time.time() - begin)
 
             except Exception as e:
                 self.log("I got trouble with connection: '{}'.".format(e))
                 Event().wait(self.delay_retry)
 
-        self.log("Received from server: '{}'.".format(received))
+    @staticmethod
+    def is_reply(received):
 
-        self.handle(what=parts[1], params=parts[2:])
+        parts = [i for i in received.split("/") if len(i)]
+        return len(parts) > 1 and parts[0] == "reply"
 
     def retry_demand(self, server_response):
 
@@ -92,6 +199,29 @@ class HotellingBot(GenericBotClient):
     with open("hotelling_server/parameters/game.json") as f:
         game_parameters = json.load(f)
 
+    commands = dict(GenericBotClient.commands, **{
+
+        # Server replies, 'reply_init' holds the firm state or the customer figures after the position
+        "reply_init": (int, int, str, int, auto, ...),
+        "reply_customer_firm_choices": (int, int, int, int, int),
+        "reply_customer_choice_recording": (int, int),
+        "reply_firm_passive_opponent_choice": (int, int, int),
+        "reply_firm_active_choice_recording": (int, ),
+        "reply_firm_active_customer_choices": (int, ...),
+        "reply_firm_passive_customer_choices": (int, ...),
+
+        # Own messages
+        "ask_customer_firm_choices": (),
+        "customer_choice": (int, int, int, int),
+        "customer_end_of_turn": (int, ),
+        "firm_passive_beginning_of_turn": (),
+        "firm_active_beginning_of_turn": (int, int),
+        "ask_firm_passive_customer_choices": (),
+        "ask_firm_active_customer_choices": (),
+        "firm_active_end_of_turn": (tuple, int),
+        "firm_passive_end_of_turn": (tuple, int)
+    })
+
     def __init__(self, name=None):
         super().__init__()
 
@@ -259,9 +389,9 @@ class HotellingBot(GenericBotClient):
 
     def ask_customer_choice_recording(self, extra_view_choice, firm_choice):
         self.state = "customer_choice_recording"
-        self.ask_server("ask_customer_choice_recording/" + "/".join([str(i) for i in [
+        self.ask_server_then("ask_customer_choice_recording/" + "/".join([str(i) for i in [
             self.game_id, self.t, extra_view_choice, firm_choice
-        ]]))
+        ]]), "ask_customer_firm_choices/{}/{}".format(self.game_id, self.t + 1))
 
     def reply_customer_choice_recording(self, t, end):
         if self.t == t and self.state == "customer_choice_recording":
@@ -273,7 +403,8 @@ class HotellingBot(GenericBotClient):
 
     def ask_firm_passive_opponent_choice(self):
         self.state = "firm_opponent_choice"
-        self.ask_server("ask_firm_passive_opponent_choice/{}/{}".format(self.game_id, self.t))
+        self.ask_server_then("ask_firm_passive_opponent_choice/{}/{}".format(self.game_id, self.t),
+                             "ask_firm_passive_customer_choices/{}/{}".format(self.game_id, self.t))
 
     def reply_firm_passive_opponent_choice(self, t, position, price):
         if self.t == t and self.state == "firm_opponent_choice":
@@ -286,8 +417,9 @@ class HotellingBot(GenericBotClient):
 
     def ask_firm_active_choice_recording(self, position, price):
         self.state = "firm_choice_recording"
-        self.ask_server("ask_firm_active_choice_recording/" + "/".join(
-            [str(i) for i in [self.game_id, self.t, position, price]]))
+        self.ask_server_then("ask_firm_active_choice_recording/" + "/".join(
+            [str(i) for i in [self.game_id, self.t, position, price]]),
+            "ask_firm_active_customer_choices/{}/{}".format(self.game_id, self.t))
 
     def reply_firm_active_choice_recording(self, t):
         if self.t == t and self.state == "firm_choice_recording":
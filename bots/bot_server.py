@@ -1,8 +1,9 @@
-from multiprocessing import Queue, Event
+from multiprocessing import Event
+from queue import Queue
 import json
 import numpy as np
 
-from utils.utils import Logger
+from utils.utils import Logger, CommandRouter
 
 from hotelling_server.control import server
 
@@ -11,6 +12,13 @@ class BotController(Logger):
 
     name = "BotController"
 
+    # Messages put on the queue, arguments are passed as they are
+    messages = {
+        "server_running": None,
+        "server_error": None,
+        "server_request": None
+    }
+
     def __init__(self, firm):
 
         self.role = firm
@@ -24,6 +32,8 @@ class BotController(Logger):
         self.server = server.Server(controller=self)
         self.game = BotGame(controller=self)
 
+        self.message_router = CommandRouter(self, self.messages)
+
     def setup(self):
 
         for key in ["network", "game", "folders", "map_android_id_server_id", "parametrization"]:
@@ -72,12 +82,8 @@ class BotController(Logger):
     # noinspection PyMethodMayBeStatic
     def handle_message(self, message):
 
-        command = message[0]
-        args = message[1:]
-        if len(args):
-            eval("self.{}(*args)".format(command))
-        else:
-            eval("self.{}()".format(command))
+        command, args = self.message_router.resolve(message[0], message[1:])
+        command(*args)
 
     def server_running(self):
         self.log("Server running.")
@@ -86,9 +92,14 @@ class BotController(Logger):
         self.log("Server error: {}.".format(arg))
         self.queue.put("break")
 
-    def server_request(self, server_data):
-        response = self.game.handle_request(server_data)
-        self.server.queue.put(("reply", response))
+    def server_request(self, server_data, reply):
+
+        try:
+            reply.set_result(self.game.handle_request(server_data))
+
+        except Exception as err:
+            reply.set_exception(err)
+            raise
 
     def get_parameters(self, key):
 
@@ -99,6 +110,17 @@ class BotGame(Logger):
 
     name = "BotGame"
 
+    # Commands a client may send, with the types of their arguments
+    commands = {
+        "ask_init": (str, ),
+        "ask_firm_passive_opponent_choice": (int, int),
+        "ask_firm_passive_n_clients": (int, int),
+        "ask_firm_active_choice_recording": (int, int, int, int),
+        "ask_firm_active_n_clients": (int, int),
+        "ask_customer_firm_choices": (int, int),
+        "ask_customer_choice_recording": (int, int, int, int)
+    }
+
     def __init__(self, controller):
         super().__init__()
 
@@ -106,6 +128,8 @@ class BotGame(Logger):
         self.t = 0
         self.end = -1
 
+        self.command_router = CommandRouter(self, self.commands)
+
     def handle_request(self, request):
 
         self.log("Got request: '{}'.".format(request))
@@ -113,11 +137,8 @@ class BotGame(Logger):
         # retrieve whole command
         whole = [i for i in request.split("/") if i != ""]
 
-        # retrieve method
-        command = eval("self.{}".format(whole[0]))
-
-        # retrieve method arguments
-        args = [int(a) if a.isdigit() else a for a in whole[1:]]
+        # retrieve method and its typed arguments
+        command, args = self.command_router.resolve(whole[0], whole[1:])
 
         # call method
         to_client = command(*args)
@@ -48,6 +48,9 @@ class HotellingLocalBots(Logger, Thread):
             if not self.controller.server.is_alive() or self.stopped():
                 return 0
 
+            # Several sessions may be waiting for their players
+            self._stop_event.wait(0.1)
+
         # start to init bots
         self.init()
 
@@ -69,7 +72,8 @@ class HotellingLocalBots(Logger, Thread):
                 self.play_customer(customer_id)
                 self.data.save()
 
-            Event().wait(1)
+            # Stopping does not wait for the next turn of the bots
+            self._stop_event.wait(1)
 
             self.time_manager.check_state()
 
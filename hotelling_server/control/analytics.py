@@ -0,0 +1,226 @@
+"""Figures of the 'Statistician' for many backups, and their mean across sessions.
+
+Run from the repository root:
+
+    python -m hotelling_server.control.analytics [--by key ...] [--processes n] [file ...]
+
+The figures of each backup (every one of the results folder if none is given)
+are computed by a pool of processes, and kept in 'results/analytics.cache':
+a backup is only analysed again if it changed since. Sessions are then
+grouped by the values of parametrization keys ('--by', exploration_cost by
+default), and each figure is averaged across the sessions of a group, turn by
+turn.
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import pickle
+import sys
+from multiprocessing import Pool
+from os import path, getcwd, replace
+
+import numpy as np
+
+from utils.utils import Logger
+from hotelling_server.control.backup import Backup
+from hotelling_server.control.statistician import Statistician
+
+
+def analyse(file):
+    """figures of the session saved in 'file', and its parametrization"""
+
+    data = Backup.read(file)
+
+    if data is None:
+        raise ValueError("{} could not be read".format(file))
+
+    return {
+        "parametrization": data["parametrization"] or {},
+        "turns": len(data["history"]),
+        "figures": Statistician.series(data["history"]),
+        "version": Analytics.version
+    }
+
+
+def silence():
+    """loading a backup is logged: not by the processes of the pool"""
+
+    sys.stdout = open(os.devnull, "w")
+
+
+def analyse_in_pool(file):
+    """'analyse' for a pool: (file, figures or error)"""
+
+    try:
+        return file, analyse(file)
+
+    except Exception as err:
+        return file, err
+
+
+class Analytics(Logger):
+    """figures of backups, cached by file: each entry is kept with the modification time, size and
+    hash of the files of the backup (snapshot and journal)"""
+
+    name = "Analytics"
+
+    # Of the figures: cached ones of another version are computed again
+    version = 2
+
+    def __init__(self, cache_file=None):
+
+        self.cache_file = cache_file or getcwd() + "/results/analytics.cache"
+        self.cache = {}
+
+        if path.exists(self.cache_file):
+            with open(self.cache_file, "rb") as file:
+                self.cache = pickle.load(file)
+
+    @staticmethod
+    def files(file):
+        return [f for f in (file, path.splitext(file)[0] + ".journal") if path.exists(f)]
+
+    @classmethod
+    def stamp(cls, file):
+        return tuple((os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in cls.files(file))
+
+    @classmethod
+    def hash(cls, file):
+
+        digest = hashlib.sha1()
+
+        for f in cls.files(file):
+            with open(f, "rb") as content:
+                for block in iter(lambda: content.read(2 ** 20), b""):
+                    digest.update(block)
+
+        return digest.hexdigest()
+
+    def cached(self, file):
+        """figures of 'file' if they are in the cache and it did not change since"""
+
+        entry = self.cache.get(path.abspath(file))
+
+        if entry is None or entry["figures"].get("version") != self.version:
+            return
+
+        if entry["stamp"] == self.stamp(file):
+            return entry["figures"]
+
+        # Touched or copied, but the same content
+        if entry["hash"] == self.hash(file):
+            entry["stamp"] = self.stamp(file)
+            return entry["figures"]
+
+    def run(self, files, processes=None):
+        """figures of each file: the ones not in the cache are computed by a pool of processes"""
+
+        results = {}
+        missing = []
+
+        for file in files:
+            figures = self.cached(file)
+
+            if figures is None:
+                missing.append(file)
+            else:
+                results[file] = figures
+
+        self.log("{} backup(s) in the cache, {} to analyse.".format(len(results), len(missing)))
+
+        if missing:
+            with Pool(processes, initializer=silence) as pool:
+                for file, figures in pool.imap_unordered(analyse_in_pool, missing):
+
+                    if isinstance(figures, Exception):
+                        self.log("{}: {}".format(file, figures))
+                        continue
+
+                    results[file] = figures
+                    self.cache[path.abspath(file)] = {
+                        "stamp": self.stamp(file), "hash": self.hash(file), "figures": figures}
+
+        self.save()
+
+        return results
+
+    def save(self):
+
+        with open(self.cache_file + ".tmp", "wb") as file:
+            pickle.dump(self.cache, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        replace(self.cache_file + ".tmp", self.cache_file)
+
+    @staticmethod
+    def aggregate(results, by=("exploration_cost", )):
+        """for each value of the parametrization keys 'by': the number of sessions, and the mean of
+        each figure across them, turn by turn (over the sessions which reached the turn), see
+        'Statistician.series'"""
+
+        groups = {}
+
+        for figures in results.values():
+            group = tuple(figures["parametrization"].get(key) for key in by)
+            groups.setdefault(group, []).append(figures["figures"])
+
+        aggregated = {}
+
+        for group, sessions in groups.items():
+
+            means = {}
+
+            # Sessions without any turn have no figure
+            for key in set().union(*sessions):
+
+                values = [s[key] for s in sessions if key in s]
+
+                # Sessions of different lengths: turns they did not reach are missing values
+                length = max(len(v) for v in values)
+                padded = np.full((len(values), length) + values[0].shape[1:], np.nan)
+
+                for i, v in enumerate(values):
+                    padded[i, :len(v)] = v
+
+                means[key] = np.nanmean(padded, axis=0)
+
+            aggregated[group] = {"n_sessions": len(sessions), "figures": means}
+
+        return aggregated
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Figures of many backups, averaged across sessions.")
+    parser.add_argument("files", nargs="*", help="backups, every one of the results folder by default")
+    parser.add_argument("--by", nargs="+", default=["exploration_cost"], help="parametrization keys")
+    parser.add_argument("--processes", type=int, default=None, help="one per CPU by default")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(getcwd() + "/results/xp_*.p"))
+
+    analytics = Analytics()
+    results = analytics.run(files, args.processes)
+
+    print("{:<24}{:>10}{:>16}{:>14}{:>14}{:>16}{:>18}".format(
+        " ".join(args.by), "sessions", "last distance", "mean price", "herfindahl", "mean utility",
+        "mean extra view"))
+
+    for group, aggregated in sorted(analytics.aggregate(results, args.by).items(), key=str):
+
+        figures = aggregated["figures"]
+
+        def last(key):
+            return "{:.2f}".format(figures[key][-1]) if key in figures else "-"
+
+        def mean(key):
+            return "{:.2f}".format(np.nanmean(figures[key])) if key in figures else "-"
+
+        print("{:<24}{:>10}{:>16}{:>14}{:>14}{:>16}{:>18}".format(
+            " ".join(str(v) for v in group), aggregated["n_sessions"], last("firm_distance"), mean("mean_price"),
+            mean("herfindahl"), mean("customer_mean_utility"), mean("customer_mean_extra_view_choices")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import asyncio
+import socket
+
+from utils.utils import Logger
+from hotelling_server.control.session import split_session_id
+
+
+class AsyncGamingServer(Logger):
+    """asyncio front-end: accepts many connections concurrently,
+    requests wait for their reply without holding a thread"""
+
+    name = "AsyncGamingServer"
+
+    # Reading a request line or a header must not take longer than that (seconds)
+    read_timeout = 30
+
+    # Server-sent events: path to subscribe ('/session/<session_id>/subscribe' for a session), seconds
+    # between heartbeats and number of pushes a slow subscriber may lag behind before losing some
+    subscribe_path = "/subscribe"
+    push_heartbeat = 15
+    push_queue_size = 64
+
+    def __init__(self, parent, server_address, cont, controller_queue, server_queue):
+        self.server_queue = server_queue
+        self.cont = cont
+        self.controller_queue = controller_queue
+        self.ip = server_address[0]
+        self.parent = parent
+        self.server_address = server_address
+
+        # Bound here rather than by asyncio, which would resolve the address in an executor:
+        # 'main' returns as soon as the controller is started, and executors refuse work after that.
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(server_address)
+        sock.listen(1024)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, sock=sock))
+
+        self.time_manager = getattr(self.cont, "time_manager", None)
+
+    def serve_forever(self):
+
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+
+            # Drop the connections that are still open
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+            self.loop.close()
+
+    def shutdown(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def server_close(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.server.close)
+
+    # ------------------------------- connection handling ---------------------------------- #
+
+    async def handle_connection(self, reader, writer):
+
+        client_ip = writer.get_extra_info("peername")[0]
+
+        try:
+            while True:
+
+                request = await self.read_request(reader)
+
+                if request is None:
+                    break
+
+                method, target, body, keep_alive = request
+
+                if method not in ("GET", "POST"):
+                    self.write_response(writer, 405, "Method not allowed.", keep_alive=False)
+                    break
+
+                if self.is_subscription(target):
+                    await self.stream_pushes(writer, target.partition("?")[0])
+                    break
+
+                response = await self.dispatch(target, client_ip, body)
+
+                self.write_response(writer, 200, response, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        except Exception as err:
+            self.log("Error with client {}: '{}'.".format(client_ip, err))
+
+        finally:
+            writer.close()
+
+    async def dispatch(self, target, client_ip, body=""):
+        """a long-polled request is parked while its reply means 'ask again later', until the state of
+        its session changes. A batch is only parked while none of its commands got a reply: otherwise
+        these replies are sent at once, with the waiting one"""
+
+        data, long_poll = self.parent.parse_target(target, body)
+        deadline = self.loop.time() + long_poll
+
+        while True:
+
+            # Requests for a session are woken up by the state changes of this session
+            time_manager = self.parent.session_time_manager(data) or self.time_manager
+            version = self.state_version(time_manager)
+            reply = self.parent.submit_request(data) if data else None
+
+            if reply is None:
+                break
+
+            try:
+                await asyncio.wrap_future(reply, loop=self.loop)
+
+            # Reported by 'complete_request'
+            except Exception:
+                pass
+
+            remaining = deadline - self.loop.time()
+
+            if remaining <= 0 or not self.parent.is_waiting(reply) or self.parent.answered_in_part(reply):
+                break
+
+            # No state change comes after the end of the game
+            if self.is_over(time_manager):
+                break
+
+            # A session created by this very request is asked again at once
+            if time_manager is (self.parent.session_time_manager(data) or self.time_manager):
+                await self.wait_state_change(time_manager, version, remaining)
+
+        return self.parent.complete_request(data, client_ip, reply)
+
+    @staticmethod
+    def state_version(time_manager):
+        return time_manager.state_version if time_manager is not None else 0
+
+    @staticmethod
+    def is_over(time_manager):
+        return time_manager is not None and time_manager.state == "end_game"
+
+    async def wait_state_change(self, time_manager, version, timeout):
+        """park until the time manager leaves the state seen at 'version'"""
+
+        changed = asyncio.Event()
+
+        def listener(state, t):
+            if not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(changed.set)
+
+        time_manager.state_listeners.append(listener)
+
+        try:
+            # The state may have changed while the request was processed
+            if time_manager.state_version == version:
+                await asyncio.wait_for(changed.wait(), timeout)
+
+        except asyncio.TimeoutError:
+            pass
+
+        finally:
+            time_manager.state_listeners.remove(listener)
+
+    # ------------------------------- server push ----------------------------------------- #
+
+    @classmethod
+    def is_subscription(cls, target):
+        return split_session_id(target.partition("?")[0])[1] == cls.subscribe_path
+
+    def push(self, queue, message):
+
+        try:
+            queue.put_nowait(message)
+
+        except asyncio.QueueFull:
+            self.log("A subscriber is too slow, a push is dropped.")
+
+    async def stream_pushes(self, writer, path):
+        """keep the connection open and write a server-sent event at each state change of a session"""
+
+        session = self.parent.session_of(path)
+        time_manager = getattr(session, "time_manager", None)
+
+        if time_manager is None:
+            self.write_response(writer, 404, "Push is not available.", keep_alive=False)
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+
+        queue = asyncio.Queue(maxsize=self.push_queue_size)
+        queue.put_nowait(self.parent.state_message(session, time_manager.state, time_manager.t))
+
+        # Called from the thread which changed the state
+        def listener(state, t):
+            if not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(self.push, queue, self.parent.state_message(session, state, t))
+
+        time_manager.state_listeners.append(listener)
+
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), self.push_heartbeat)
+                    writer.write("data: {}\n\n".format(message).encode())
+
+                # Lets both sides notice a dead connection
+                except asyncio.TimeoutError:
+                    writer.write(b": heartbeat\n\n")
+
+                await writer.drain()
+
+        finally:
+            time_manager.state_listeners.remove(listener)
+
+    # ------------------------------- HTTP parsing ------------------------------------------ #
+
+    @classmethod
+    async def read_request(cls, reader):
+        """returns (method, target, body, keep_alive) or None if the client left"""
+
+        request_line = await asyncio.wait_for(reader.readline(), cls.read_timeout)
+
+        if not request_line:
+            return
+
+        method, target, version = request_line.decode("latin-1").split()
+
+        keep_alive = version == "HTTP/1.1"
+        content_length = 0
+
+        while True:
+            line = await asyncio.wait_for(reader.readline(), cls.read_timeout)
+
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+            key, _, value = line.decode("latin-1").partition(":")
+
+            if key.strip().lower() == "connection":
+                keep_alive = value.strip().lower() == "keep-alive" or \
+                    (keep_alive and value.strip().lower() != "close")
+
+            elif key.strip().lower() == "content-length":
+                content_length = int(value)
+
+        body = await asyncio.wait_for(reader.readexactly(content_length), cls.read_timeout)
+
+        return method, target, body.decode(), keep_alive
+
+    @staticmethod
+    def write_response(writer, status, response, keep_alive):
+
+        body = response.encode()
+
+        writer.write(
+            "HTTP/1.1 {} {}\r\n"
+            "Content-type: text/html\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: {}\r\n\r\n".format(
+                status, "OK" if status == 200 else "Error", len(body), "keep-alive" if keep_alive else "close"
+            ).encode() + body
+        )
@@ -1,16 +1,120 @@
-from os import path, mkdir, getcwd
+from os import path, mkdir, getcwd, fsync, replace
+import os
+import mmap
+from queue import Queue, Empty
+from threading import Thread, Lock, Condition
+import copy
 import json
 import pickle
+import struct
+import time
+import zlib
 from datetime import datetime
+import numpy as np
 from utils.utils import Logger
+from hotelling_server.control.history import History
+from hotelling_server.control.state import State
+from hotelling_server.control.database import Database
+from hotelling_server.control.catalog import Catalog
+from hotelling_server.control.metrics import session_label
 
 
 class Backup(Logger):
+    """'file' holds a snapshot of the data, the journal next to it ('.journal') holds the changes
+    made since. Both are rebuilt into the whole data by 'load'.
+
+    Saves only compute what changed, a writer thread does the disk work: it gathers the saves
+    piled up meanwhile in one write. Each save gets a version, 'durable_version' is the last one fsynced.
+
+    A new snapshot keeps the former one and its journal ('.prev'): if the last snapshot is damaged,
+    'load' starts from the former one, and replays both journals.
+
+    The large arrays of a snapshot (the columns of the history) follow its pickle rather than being in it,
+    so that a reader may map them in memory instead of reading them (see 'read_snapshot')"""
+
+    name = "Backup"
+
+    # Files start with a tag, followed by checksummed pickles: one for the snapshot, then its arrays,
+    # one per record for the journal
+    snapshot_tag = b"hotelling-snapshot-2\n"
+    journal_tag = b"hotelling-journal-1\n"
+
+    # Size and crc32 of the pickle (and number of arrays following it for a snapshot), of an array
+    snapshot_header = struct.Struct("<QII")
+    header = struct.Struct("<II")
+    array_header = struct.Struct("<QI")
+
+    # Arrays of a snapshot from this size (bytes) follow its pickle, starting at a multiple of 'alignment'
+    out_of_band = 1 << 16
+    alignment = 64
+
+    # What unpickling a damaged snapshot may raise: it is then skipped for the former one
+    unpickling_errors = (struct.error, EOFError, pickle.UnpicklingError, AttributeError, ValueError, ImportError)
+
+    # Seconds for the writer to put the saves on disk when flushing, and between checks that it is alive
+    flush_timeout = 30
+    writer_check = 1
 
     def __init__(self, controller):
 
         self.controller = controller
-        self.file = "{}/xp_{}.p".format(self.folder, datetime.now().strftime("%y-%m-%d_%H-%M-%S-%f"))
+
+        # Sessions hosted next to the controller's own game each get their file
+        self.session_id = getattr(controller, "session_id", None)
+        prefix = "xp_" if self.session_id is None else "xp_{}_".format(self.session_id)
+
+        self.file = "{}/{}{}.p".format(self.folder, prefix, datetime.now().strftime("%y-%m-%d_%H-%M-%S-%f"))
+
+        # fsync after each 'request', at each new 'turn', or every 'interval' ms
+        self.param = self.controller.data.param.get("backup", {})
+        self.fsync = self.param.get("fsync", "turn")
+        self.fsync_interval = self.param.get("fsync_interval", 200) / 1000
+        self.snapshot_every = self.param.get("snapshot_every", 1000)
+        self.write_behind = self.param.get("write_behind", True)
+
+        # History in memory-mapped files next to the backup, see 'History'
+        self.spill_history = self.param.get("spill_history", False)
+
+        # Results also stored in this SQLite database (relative to the working directory), see 'Database'
+        database = self.param.get("database", "")
+        self.database = Database(path.join(getcwd(), database)) if database else None
+        self.database_session = None
+        self.database_turns = 0
+
+        self.journal = None
+
+        # Version of the last save, and of the last one included in the snapshot
+        self.seq = 0
+        self.snapshot_seq = 0
+
+        # What the saves add up to, in order to only write what changed
+        self.shadow = None
+
+        # Saves come from the controller and from the local bots
+        self.lock = Lock()
+
+        # Writer side
+        self.jobs = Queue()
+        self.writer = None
+        self.writer_error = None
+        self.written = (0, 0)  # (version, t) of the last record written
+        self.synced_t = 0
+        self.synced_time = time.time()
+
+        self.durable_version = 0
+        self.durable = Condition()
+
+        # Standby processes following the saves, see 'ReplicationServer'
+        self.replicas = []
+
+        # Summary of this backup for the results folder, written at the first save, the end of the game and closing
+        self.catalog = Catalog(self.folder)
+
+        self.session = session_label(controller)
+        self.write_duration = controller.metrics.histogram(
+            "hotelling_backup_write_duration_seconds", "Saves, in the thread of the request.", ("session", ))
+        self.written_bytes = controller.metrics.counter(
+            "hotelling_backup_written_bytes_total", "Bytes written by the writer thread.", ("session", "file"))
 
     @property
     def folder(self):
@@ -20,27 +124,649 @@ class Backup(Logger):
             mkdir(folder)
         return folder
 
+    @property
+    def journal_file(self):
+        return path.splitext(self.file)[0] + ".journal"
+
+    @property
+    def files(self):
+        """files of the backup on disk"""
+
+        return [file for file in (self.file, self.journal_file, self.file + ".prev", self.journal_file + ".prev")
+                if path.exists(file)]
+
+    @property
+    def history_folder(self):
+        return path.splitext(self.file)[0] + ".history" if self.spill_history else None
+
     def write(self, data):
+        """returns the version of the data saved"""
+
+        begin = time.perf_counter()
+        version = self.save(data)
+        self.write_duration.labels(self.session).observe(time.perf_counter() - begin)
+
+        return version
+
+    def save(self, data):
+        """hand what changed since the last save to the writer, returns its version"""
+
+        with self.lock:
+
+            if self.shadow is None or self.seq - self.snapshot_seq >= self.snapshot_every:
+                self.seq += 1
+
+                # Recorded as well: the journal kept with the former snapshot leads up to this one
+                if self.shadow is not None:
+                    changes = self.changes(data)
+                    changes["seq"] = self.seq
+                    self.submit(("record", self.seq, data["time_manager_t"], changes))
+                    self.publish(changes)
+
+                # Otherwise standby processes get the whole data
+                elif self.replicas:
+                    self.publish(dict(copy.deepcopy(data), journal_seq=self.seq))
+
+                first = self.shadow is None
+
+                self.snapshot_seq = self.seq
+                self.shadow = copy.deepcopy(data)
+                self.submit(("snapshot", self.seq, copy.deepcopy(data)))
+
+                # The backup is listed as soon as it is on disk
+                if first:
+                    self.submit(("catalog", self.summary()))
+
+                return self.seq
+
+            changes = self.changes(data)
+
+            if changes:
+                self.seq += 1
+                changes["seq"] = self.seq
+                self.submit(("record", self.seq, data["time_manager_t"], changes))
+                self.publish(changes)
+
+                if changes.get("time_manager_state") == "end_game":
+                    self.submit(("catalog", self.summary()))
+
+            return self.seq
+
+    def summary(self):
+        """for the catalog, see 'Catalog.summary'"""
+
+        return Catalog.summary(self.file, self.shadow, self.session_id)
+
+    def publish(self, changes):
+        """send a save to the standby processes, before the reply it comes with"""
+
+        if self.replicas:
+            payload = pickle.dumps(changes, protocol=pickle.HIGHEST_PROTOCOL)
+
+            for replica in list(self.replicas):
+                replica.send(self.session_id, payload)
+
+    def submit(self, job):
+
+        if not self.write_behind:
+            self.process([job])
+            return
+
+        if self.writer is None:
+            self.writer = Thread(target=self.run_writer, daemon=True)
+            self.writer.start()
+
+        self.jobs.put(job)
+
+    def wait_durable(self, version, timeout=None):
+        """wait until the saves up to 'version' are fsynced, returns whether they are.
+        Raises the error which stopped the writer, if it stopped"""
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.durable:
+
+            while self.durable_version < version:
+
+                self.check_writer()
+
+                remaining = self.writer_check if deadline is None else min(self.writer_check, deadline - time.time())
+
+                if remaining <= 0:
+                    return False
+
+                self.durable.wait(remaining)
+
+            return True
+
+    def check_writer(self):
+
+        if self.writer_error is not None:
+            raise self.writer_error
+
+        if self.writer is not None and not self.writer.is_alive():
+            raise RuntimeError("The writer of '{}' stopped.".format(self.file))
+
+    def flush(self):
+        """write and fsync every save made so far, raises TimeoutError if they are not after 'flush_timeout'"""
+
+        with self.lock:
+
+            # Nothing saved since the creation, the last load or the last close
+            if self.shadow is None:
+                return
+
+            version = self.seq
+            self.submit(("flush", ))
+
+        if not self.wait_durable(version, self.flush_timeout):
+            raise TimeoutError("Saves of '{}' are not on disk after {} s.".format(self.file, self.flush_timeout))
+
+    def close(self):
+
+        # The turns played since the last snapshot
+        with self.lock:
+            if self.shadow is not None:
+                self.submit(("catalog", self.summary()))
+
+        # Closing goes on: the files are closed whatever was written
+        try:
+            self.flush()
+
+        except Exception as err:
+            self.log("Saves may be lost: '{}'.".format(err))
+
+        # A save after closing starts a new snapshot
+        self.shadow = None
+
+        if self.writer is not None:
+            self.jobs.put(None)
+            self.writer.join(self.flush_timeout)
+            self.writer = None
+            self.writer_error = None
+
+            # Left by a writer which stopped on an error, the next one starts afresh
+            self.jobs = Queue()
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+        if self.database is not None:
+            self.database.close()
+
+    # ------------------------------ writer thread --------------------------------------------- #
+
+    def run_writer(self):
+        """the error stopping the writer is kept for 'wait_durable' to raise it"""
+
+        try:
+            self.write_jobs()
+
+        except Exception as err:
+            self.log("Writer stopped: '{}'.".format(err))
+
+            with self.durable:
+                self.writer_error = err
+                self.durable.notify_all()
+
+    def write_jobs(self):
+
+        # With the 'interval' policy, wake up to fsync even without new saves
+        timeout = self.fsync_interval if self.fsync == "interval" else None
+
+        while True:
+
+            try:
+                jobs = [self.jobs.get(timeout=timeout)]
+            except Empty:
+                jobs = []
+
+            # Every save waiting is written at once
+            while not self.jobs.empty():
+                jobs.append(self.jobs.get())
+
+            if None in jobs:
+                self.process(jobs[:jobs.index(None)])
+                break
+
+            self.process(jobs)
+
+    def process(self, jobs):
+
+        records = []
+        summaries = []
+        force = False
+
+        for job in jobs:
+
+            if job[0] == "record":
+                records.append(job)
+
+            elif job[0] == "snapshot":
+                self.append(records)
+                records = []
+                self.write_snapshot(job[1], job[2])
+
+            elif job[0] == "catalog":
+                summaries.append(job[1])
+
+            else:
+                force = True
+
+        self.append(records)
+        self.sync(force)
+
+        # Only the last summary of the batch matters
+        if summaries:
+            self.catalog.add(summaries[-1])
+
+        if self.database is not None:
+            self.store(jobs)
+
+    def append(self, records):
+
+        if not records:
+            return
+
+        frames = []
+
+        for _, _, _, changes in records:
+            record = pickle.dumps(changes, protocol=pickle.HIGHEST_PROTOCOL)
+            frames.append(self.header.pack(len(record), zlib.crc32(record)) + record)
+
+        frames = b"".join(frames)
+        self.journal.write(frames)
+        self.journal.flush()
+
+        self.written_bytes.labels(self.session, "journal").inc(len(frames))
+
+        self.written = records[-1][1:3]
+
+    def store(self, jobs):
+        """turns ended in these saves go to the database, once they are on disk"""
+
+        for job in jobs:
+
+            if job[0] == "snapshot":
+                data = job[2]
+                self.database_session, self.database_turns = self.database.add_session(
+                    path.basename(self.file), self.session_id, data, self.controller.data.param["game"])
+                rows = data["history"].rows(self.database_turns)
+
+            elif job[0] == "record" and self.database_session is not None:
+                rows = job[3].get("history")
+
+            else:
+                continue
+
+            if rows:
+                self.database.add_turns(self.database_session, self.database_turns, rows)
+                self.database_turns += len(rows["firm_positions"])
+
+    def write_snapshot(self, version, data):
+        """compact the journal: the whole data goes to a new snapshot, the journal restarts empty.
+        The former snapshot and journal are kept until the next one"""
 
         self.log("Saving data to {}".format(self.file))
 
-        with open(self.file, "wb") as file:
-            pickle.dump(obj=data, file=file)
+        data["journal_seq"] = version
+
+        # Large arrays follow the pickle
+        arrays = []
+        snapshot = pickle.dumps(
+            data, protocol=pickle.HIGHEST_PROTOCOL,
+            buffer_callback=lambda array: len(array.raw()) < self.out_of_band or arrays.append(array))
+
+        # A crash while writing leaves the former snapshot as it was
+        with open(self.file + ".tmp", "wb") as file:
+            file.write(self.snapshot_tag + self.snapshot_header.pack(len(snapshot), zlib.crc32(snapshot), len(arrays)))
+            file.write(snapshot)
+
+            for array in arrays:
+                array = array.raw()
+                file.write(self.array_header.pack(len(array), zlib.crc32(array)))
+                file.write(bytes(-file.tell() % self.alignment))
+                file.write(array)
+
+            size = file.tell()
+            file.flush()
+            fsync(file.fileno())
+
+        self.written_bytes.labels(self.session, "snapshot").inc(size)
+
+        # Whenever a crash happens in between, a snapshot and the journals following it are on disk
+        if path.exists(self.file):
+            replace(self.file, self.file + ".prev")
+
+        replace(self.file + ".tmp", self.file)
+
+        if self.journal is not None:
+            self.journal.close()
+
+        if path.exists(self.journal_file):
+            replace(self.journal_file, self.journal_file + ".prev")
+
+        self.journal = open(self.journal_file, "wb")
+        self.journal.write(self.journal_tag)
+        self.journal.flush()
+        fsync(self.journal.fileno())
+
+        # Renamings are durable once the folder is
+        folder = os.open(path.dirname(self.file), os.O_RDONLY)
+        try:
+            fsync(folder)
+        finally:
+            os.close(folder)
+
+        self.written = (version, data["time_manager_t"])
+        self.synced_t = data["time_manager_t"]
+        self.set_durable(version)
+
+    def sync(self, force=False):
+
+        version, t = self.written
+        now = time.time()
+
+        if version <= self.durable_version:
+            return
+
+        if force or self.fsync == "request" or \
+                (self.fsync == "turn" and t != self.synced_t) or \
+                (self.fsync == "interval" and now - self.synced_time >= self.fsync_interval):
+
+            fsync(self.journal.fileno())
+            self.synced_t = t
+            self.synced_time = now
+            self.set_durable(version)
+
+    def set_durable(self, version):
+
+        with self.durable:
+            self.durable_version = version
+            self.durable.notify_all()
+
+    def changes(self, data):
+        """what differs from the shadow: changed bytes of 'current_state', new rows of 'history',
+        other keys as a whole. The shadow is brought up to date"""
+
+        changes = {}
+
+        for key, value in data.items():
+
+            if key == "history":
+                rows = value.rows(len(self.shadow[key]))
+
+                if rows:
+                    changes[key] = rows
+                    self.shadow[key] = copy.copy(value)
+
+            # Unless a new game changed the number of agents: then the whole state, as other keys
+            elif isinstance(value, State) and getattr(self.shadow[key], "shape", None) == value.shape:
+                patch = value.diff(self.shadow[key])
+
+                if patch is not None:
+                    changes[key] = patch
+                    self.shadow[key].patch(patch)
+
+            elif not self.same(value, self.shadow.get(key)):
+                changes[key] = copy.deepcopy(value)
+                self.shadow[key] = copy.deepcopy(value)
+
+        return changes
+
+    @staticmethod
+    def same(a, b):
+
+        if type(a) is not type(b):
+            return False
+
+        if isinstance(a, np.ndarray):
+            return a.dtype == b.dtype and np.array_equal(a, b)
+
+        try:
+            return bool(a == b)
+
+        # Lists holding arrays
+        except ValueError:
+            return len(a) == len(b) and all(Backup.same(i, j) for i, j in zip(a, b))
 
     def load(self, file):
+        """the data saved in 'file', see 'read'"""
 
-        if not path.exists(file):
+        # Saves of a former game must not end up in the file loaded
+        self.close()
+
+        self.file = file
+
+        data = self.read(file)
+
+        if data is None:
             return "error"
 
-        else:
-            self.file = file
-            with open(self.file, "rb") as file:
+        self.seq = data.pop("journal_seq")
+
+        # Next write starts a new snapshot including the replayed changes
+        self.snapshot_seq = self.seq
+        self.shadow = None
+        self.durable_version = self.seq
+
+        return data
+
+    @classmethod
+    def read(cls, file):
+        """the data saved in 'file': its last valid snapshot, plus the journal records following it.
+        Its version is 'journal_seq'. None if no snapshot is valid"""
+
+        data, journals = cls.open_snapshot(file)
+
+        if data is None:
+            return
+
+        seq = data.pop("journal_seq", 0)
+        n_records = 0
+
+        for changes in cls.records(journals, seq):
+            cls.replay(data, changes)
+            seq = changes["seq"]
+            n_records += 1
+
+        cls.log("Loaded version {} (turn {}): {} journal record(s) replayed.".format(
+            seq, data["time_manager_t"], n_records))
+
+        data["journal_seq"] = seq
+
+        return data
+
+    @classmethod
+    def open_snapshot(cls, file, maps=None):
+        """(data of the last valid snapshot of 'file', journals whose records follow it), see 'read_snapshot'.
+        The data is None if no snapshot is valid"""
+
+        journal_file = path.splitext(file)[0] + ".journal"
+
+        data = cls.read_snapshot(file, maps)
+        journals = [journal_file]
+
+        # The records following the former snapshot begin in the former journal
+        if data is None:
+            cls.log("Snapshot {} is missing or damaged, trying the former one.".format(file))
+            data = cls.read_snapshot(file + ".prev", maps)
+            journals.insert(0, journal_file + ".prev")
+
+        if data is not None:
+            cls.upgrade(data)
+
+        return data, journals
+
+    @classmethod
+    def records(cls, journals, seq):
+        """records of the journals following version 'seq', in order"""
+
+        # Records up to the snapshot are already in it, the first missing one ends the replay
+        for changes in cls.read_journals(journals):
+
+            if changes["seq"] <= seq:
+                continue
+
+            if changes["seq"] != seq + 1:
+                cls.log("Record {} is missing: replay stops.".format(seq + 1))
+                break
+
+            yield changes
+            seq = changes["seq"]
+
+    @staticmethod
+    def upgrade(data):
+        """history and current state of the backups of the released version, saved before they had
+        their own stores (dicts), put in their stores"""
+
+        history = data["history"]
+
+        if isinstance(history, dict):
+            data["history"] = History.from_lists({key: State.value_dtype(key) for key in history}, history)
+
+        if isinstance(data["current_state"], dict):
+            data["current_state"] = State.from_dict(data["current_state"])
+
+    @classmethod
+    def read_snapshot(cls, file, maps=None):
+        """the data of a snapshot, None if it is missing or damaged. With a list 'maps', the arrays following
+        the pickle are read-only views on the file mapped in memory (added to 'maps') rather than read"""
+
+        if not path.exists(file):
+            return
+
+        with open(file, "rb") as snapshot_file:
+
+            # Snapshots without checksum are a bare pickle
+            if snapshot_file.read(len(cls.snapshot_tag)) != cls.snapshot_tag:
+                snapshot_file.seek(0)
                 try:
-                    data = pickle.load(file=file)
-                except EOFError:
-                    return "error"
+                    return pickle.load(snapshot_file)
+                except cls.unpickling_errors:
+                    return
+
+            header = cls.read_header(snapshot_file, cls.snapshot_header)
+
+            if header is None:
+                return
+
+            size, crc, n_arrays = header
+            snapshot = snapshot_file.read(size)
+
+            if len(snapshot) < size or zlib.crc32(snapshot) != crc:
+                return
+
+            arrays = []
+
+            for _ in range(n_arrays):
+                header = cls.read_header(snapshot_file, cls.array_header)
+
+                if header is None:
+                    return
+
+                size, crc = header
+                snapshot_file.seek(-snapshot_file.tell() % cls.alignment, os.SEEK_CUR)
+
+                offset = snapshot_file.tell()
+                array = cls.read_array(snapshot_file, size, crc, keep=maps is None)
+
+                if array is None:
+                    return
+
+                arrays.append(array if maps is None else (offset, size))
+
+            if maps is not None and arrays:
+                maps.append(mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ))
+                arrays = [memoryview(maps[-1])[offset:offset + size] for offset, size in arrays]
+
+        try:
+            return pickle.loads(snapshot, buffers=arrays)
+        except cls.unpickling_errors:
+            return
+
+    @staticmethod
+    def read_header(file, header):
+        """the fields of 'header' read from 'file', None if the file ends before"""
+
+        fields = file.read(header.size)
+
+        return header.unpack(fields) if len(fields) == header.size else None
+
+    @classmethod
+    def read_array(cls, file, size, crc, keep=True):
+        """an array following the pickle of a snapshot, None if it is damaged. Without 'keep', it is only
+        checked, by parts: the array is not held in memory"""
+
+        if keep:
+            array = bytearray(size)
+            return array if file.readinto(array) == size and zlib.crc32(array) == crc else None
+
+        read = 0
+        check = 0
+
+        while read < size:
+            part = file.read(min(size - read, 1 << 20))
+
+            if not part:
+                return
+
+            read += len(part)
+            check = zlib.crc32(part, check)
+
+        return True if check == crc else None
+
+    @classmethod
+    def read_journals(cls, files):
+
+        for file in files:
+            yield from cls.read_journal(file)
+
+    @classmethod
+    def read_journal(cls, file):
+
+        if not path.exists(file):
+            return
+
+        with open(file, "rb") as journal:
+
+            if journal.read(len(cls.journal_tag)) != cls.journal_tag:
+                cls.log("{} is not a journal: it is ignored.".format(file))
+                return
+
+            while True:
+                frame = journal.read(cls.header.size)
+
+                # The last record may have been cut or garbled by a crash
+                if len(frame) < cls.header.size:
+                    break
+
+                size, crc = cls.header.unpack(frame)
+                record = journal.read(size)
+
+                if len(record) < size or zlib.crc32(record) != crc:
+                    break
+
+                yield pickle.loads(record)
+
+    @staticmethod
+    def replay(data, changes):
+
+        for key, value in changes.items():
+
+            if key == "seq":
+                continue
+
+            elif key == "history":
+                data[key].extend(value)
+
+            # Changed bytes, or a whole state if the number of agents changed (see 'changes')
+            elif key == "current_state" and isinstance(value, tuple):
+                data[key].patch(value)
 
-            return data
+            else:
+                data[key] = value
 
     @staticmethod
     def save_param(key, new_value):
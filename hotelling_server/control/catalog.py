@@ -0,0 +1,136 @@
+"""Catalog of the backups of the results folder.
+
+List or filter the sessions saved, without loading any of them:
+
+    python -m hotelling_server.control.catalog [key=value ...]
+
+'key' is a key of the parametrization, or 'ended'. With '--rebuild', the
+catalog is first made again from the backup files themselves.
+"""
+
+import glob
+import json
+import sys
+from os import path, getcwd, replace
+from threading import Lock
+from datetime import datetime
+
+from utils.utils import Logger
+
+
+class Catalog(Logger):
+    """summary of each backup of a folder, in 'catalog.jsonl': a line is added each time a backup
+    writes one (see 'Backup.summary'), the last line about a file holds"""
+
+    name = "Catalog"
+
+    # Backups of several sessions write to the same catalog
+    lock = Lock()
+
+    def __init__(self, folder):
+
+        self.folder = folder
+        self.file = folder + "/catalog.jsonl"
+
+    @staticmethod
+    def summary(file, data, session_id=None):
+        """what the catalog keeps of the data saved in 'file'"""
+
+        current_state = data["current_state"]
+
+        return {
+            "file": path.basename(file),
+            "session_id": session_id,
+            "parametrization": data["parametrization"],
+            "assignment": data["assignment"],
+            "turns": data["time_manager_t"],
+            "final_profits": [int(p) for p in current_state["firm_cumulative_profits"]]
+            if current_state is not None else [],
+            "ended": data["time_manager_state"] == "end_game",
+            "saved": datetime.now().strftime("%y-%m-%d %H:%M:%S")
+        }
+
+    def add(self, summary):
+
+        line = json.dumps(summary) + "\n"
+
+        with self.lock:
+            with open(self.file, "a") as file:
+                file.write(line)
+
+    def entries(self):
+        """summaries of the backups still in the folder by file name, in the order they were first saved"""
+
+        entries = {}
+
+        if not path.exists(self.file):
+            return entries
+
+        with open(self.file) as file:
+            for line in file:
+
+                # The last line may have been cut by a crash
+                try:
+                    summary = json.loads(line)
+                except ValueError:
+                    continue
+
+                entries[summary["file"]] = summary
+
+        # Backups removed since
+        return {file: summary for file, summary in entries.items() if path.exists(self.folder + "/" + file)}
+
+    def select(self, ended=None, **parametrization):
+        """summaries of the sessions with this parametrization (and ending, if not None)"""
+
+        return [
+            summary for summary in self.entries().values()
+            if (ended is None or summary["ended"] == ended) and
+            all((summary["parametrization"] or {}).get(k) == v for k, v in parametrization.items())]
+
+    def rebuild(self):
+        """make the catalog again from the backups of the folder: each one is loaded"""
+
+        from hotelling_server.control.backup import Backup
+
+        lines = []
+
+        for file in sorted(glob.glob(self.folder + "/xp_*.p")):
+
+            data = Backup.read(file)
+
+            if data is None:
+                self.log("{} could not be read.".format(file))
+                continue
+
+            lines.append(json.dumps(self.summary(file, data)) + "\n")
+
+        with self.lock:
+            with open(self.file + ".tmp", "w") as file:
+                file.writelines(lines)
+
+            replace(self.file + ".tmp", self.file)
+
+        self.log("{} backup(s) in the catalog.".format(len(lines)))
+
+
+def main():
+
+    catalog = Catalog(getcwd() + "/results")
+
+    if "--rebuild" in sys.argv:
+        catalog.rebuild()
+
+    criteria = dict(a.split("=", 1) for a in sys.argv[1:] if "=" in a)
+    criteria = {k: json.loads(v) for k, v in criteria.items()}
+
+    print("{:<36}{:>8}{:>8}{:>16}  {}".format("file", "turns", "ended", "final profits", "parametrization"))
+
+    for summary in catalog.select(**criteria):
+        print("{:<36}{:>8}{:>8}{:>16}  {}".format(
+            summary["file"], summary["turns"], "yes" if summary["ended"] else "no",
+            " ".join(str(p) for p in summary["final_profits"]), json.dumps(summary["parametrization"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import json
 from utils.utils import Logger
+from hotelling_server.control.history import History
+from hotelling_server.control.metrics import session_label
+from hotelling_server.control.state import State
 
 
 class Data(Logger):
@@ -21,9 +24,20 @@ class Data(Logger):
             "firm_states", "customer_states"
         ]
 
-        self.history = {s: [] for s in self.entries}
+        # History keeps the values of the entries as they are read from the current state
+        self.history_dtypes = {s: State.value_dtype(s) for s in self.entries}
 
-        self.current_state = {s: [] for s in self.entries}
+        self.history = History(self.history_dtypes)
+
+        # Read when the metrics are exported: the history is replaced by loads
+        session = session_label(controller)
+        controller.metrics.gauge("hotelling_history_turns", "Turns in the history.", ("session", )) \
+            .labels(session).set_function(lambda: len(self.history))
+        controller.metrics.gauge("hotelling_history_bytes", "Memory taken by the history.", ("session", )) \
+            .labels(session).set_function(lambda: sum(self.history[key].nbytes for key in self.history))
+
+        # Built by 'new', once the number of agents is known
+        self.current_state = None
 
         self.firms_id = {}  # key: game_id, value: firm_id
         self.customers_id = {}  # key: game_id, value: customer_id
@@ -49,7 +63,7 @@ class Data(Logger):
 
         self.keys = [
             "network", "game", "folders", "map_android_id_server_id",
-            "parametrization", "assignment"]
+            "parametrization", "assignment", "backup"]
 
         self.param = {}
         self.setup()
@@ -57,7 +71,8 @@ class Data(Logger):
     def new(self):
         """when a new game is launched"""
 
-        self.current_state = {s: [] for s in self.entries}
+        self.current_state = State(self.param["game"]["n_firms"], self.param["game"]["n_customers"])
+        self.history = History(self.history_dtypes, folder=self.controller.backup.history_folder)
 
         self.firms_id = {}  # key: game_id, value: firm_id
         self.customers_id = {}  # key: game_id, value: customer_id
@@ -88,8 +103,9 @@ class Data(Logger):
         self.controller.backup.save_param(key, new_value)
 
     def save(self):
+        """returns the version of the data saved, see 'Backup.durable_version'"""
 
-        self.controller.backup.write(
+        version = self.controller.backup.write(
             {
                 "history": self.history,
                 "current_state": self.current_state,
@@ -110,15 +126,32 @@ class Data(Logger):
             }
         )
 
+        self.controller.live_state.publish()
+
+        return version
+
     def write(self, key, game_id, value):
 
         self.current_state[key][game_id] = value
 
     def load(self, file):
+        """returns whether the file could be loaded"""
 
         data = self.controller.backup.load(file=file)
+
+        if data == "error":
+            return False
+
+        self.restore(data)
+
+        return True
+
+    def restore(self, data):
+        """data as saved"""
+
         self.history = data["history"]
         self.current_state = data["current_state"]
+
         self.firms_id = data["firms_id"]
         self.customers_id = data["customers_id"]
         self.bot_firms_id = data["bot_firms_id"]
@@ -136,6 +169,6 @@ class Data(Logger):
 
     def update_history(self):
 
-        for s in self.entries:
-            self.history[s].append(self.current_state[s])
+        # Values are copied: entries of the current state are modified in place during the next turn
+        self.history.append({s: self.current_state[s] for s in self.entries})
 
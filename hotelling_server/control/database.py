@@ -0,0 +1,140 @@
+import json
+import sqlite3
+
+import numpy as np
+
+from utils.utils import Logger
+
+
+class Database(Logger):
+    """results of the games in a SQLite database (WAL mode): a row per session, per turn, and per
+    agent and turn. Filled by 'Backup' as turns end, one transaction per batch of turns. For example,
+    the mean price at turn 10 across all sessions with an exploration cost of 1:
+
+        SELECT AVG(price) FROM firm_choices JOIN sessions ON sessions.id = firm_choices.session
+        WHERE t = 10 AND exploration_cost = 1
+    """
+
+    name = "Database"
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY, file TEXT UNIQUE, session_id TEXT,
+            n_firms INTEGER, n_customers INTEGER, n_positions INTEGER, n_prices INTEGER,
+            exploration_cost REAL, utility_consumption REAL, parametrization TEXT, assignment TEXT);
+
+        CREATE TABLE IF NOT EXISTS turns (
+            session INTEGER, t INTEGER, active_firm INTEGER,
+            mean_price REAL, mean_extra_view REAL, mean_utility REAL,
+            PRIMARY KEY (session, t)) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS firm_choices (
+            session INTEGER, t INTEGER, firm_id INTEGER, status TEXT,
+            position INTEGER, price INTEGER, profits INTEGER, cumulative_profits INTEGER, n_client INTEGER,
+            PRIMARY KEY (session, t, firm_id)) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS customer_choices (
+            session INTEGER, t INTEGER, customer_id INTEGER,
+            firm_choice INTEGER, extra_view INTEGER, utility INTEGER,
+            PRIMARY KEY (session, t, customer_id)) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS sessions_parametrization ON sessions (exploration_cost, utility_consumption);
+        CREATE INDEX IF NOT EXISTS turns_t ON turns (t);
+        CREATE INDEX IF NOT EXISTS firm_choices_t ON firm_choices (t);
+        CREATE INDEX IF NOT EXISTS customer_choices_t ON customer_choices (t);
+    """
+
+    # Seconds to wait for the other sessions writing to the same database
+    timeout = 10
+
+    def __init__(self, file):
+
+        self.file = file
+        self.connection = None
+
+    def connect(self):
+
+        if self.connection is None:
+
+            # Used by the writer thread of the backup, or by the requests if there is none
+            self.connection = sqlite3.connect(self.file, timeout=self.timeout, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(self.schema)
+
+        return self.connection
+
+    def close(self):
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def add_session(self, backup_file, session_id, data, game_parameters):
+        """the id of the session saved to 'backup_file', and how many turns of it are stored already.
+        A session stored already keeps its id, its other columns follow 'data'"""
+
+        connection = self.connect()
+        parametrization = data["parametrization"] or {}
+
+        with connection:
+            connection.execute(
+                "INSERT INTO sessions (file, session_id, n_firms, n_customers, n_positions, n_prices, "
+                "exploration_cost, utility_consumption, parametrization, assignment) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (file) DO UPDATE SET session_id = excluded.session_id, n_firms = excluded.n_firms, "
+                "n_customers = excluded.n_customers, n_positions = excluded.n_positions, "
+                "n_prices = excluded.n_prices, exploration_cost = excluded.exploration_cost, "
+                "utility_consumption = excluded.utility_consumption, parametrization = excluded.parametrization, "
+                "assignment = excluded.assignment",
+                (backup_file, session_id, len(data["current_state"]["firm_positions"]),
+                 len(data["current_state"]["customer_firm_choices"]),
+                 game_parameters.get("n_positions"), game_parameters.get("n_prices"),
+                 parametrization.get("exploration_cost"), parametrization.get("utility_consumption"),
+                 json.dumps(parametrization), json.dumps(data["assignment"])))
+
+        session = connection.execute("SELECT id FROM sessions WHERE file = ?", (backup_file, )).fetchone()[0]
+        n_turns = connection.execute("SELECT COUNT(*) FROM turns WHERE session = ?", (session, )).fetchone()[0]
+
+        return session, n_turns
+
+    def add_turns(self, session, start, rows):
+        """'rows': history rows of the turns from 'start', see 'History.rows'"""
+
+        positions = rows["firm_positions"]
+        prices = rows["firm_prices"]
+        status = rows["firm_status"]
+        firm_choices = rows["customer_firm_choices"]
+        extra_views = rows["customer_extra_view_choices"]
+        utilities = rows["customer_utility"]
+
+        turns = []
+        firms = []
+        customers = []
+
+        for i in range(len(positions)):
+
+            t = start + i
+
+            turns.append((
+                session, t, int(list(status[i]).index("active")), float(np.mean(prices[i])),
+                float(np.mean(extra_views[i])), float(np.mean(utilities[i]))))
+
+            firms.extend(
+                (session, t, firm_id, str(status[i][firm_id]), int(positions[i][firm_id]), int(prices[i][firm_id]),
+                 int(rows["firm_profits"][i][firm_id]), int(rows["firm_cumulative_profits"][i][firm_id]),
+                 int(rows["n_client"][i][firm_id]))
+                for firm_id in range(len(positions[i])))
+
+            customers.extend(
+                (session, t, customer_id, int(firm_choices[i][customer_id]), int(extra_views[i][customer_id]),
+                 int(utilities[i][customer_id]))
+                for customer_id in range(len(firm_choices[i])))
+
+        connection = self.connect()
+
+        # One transaction for all of them
+        with connection:
+            connection.executemany("INSERT OR REPLACE INTO turns VALUES (?, ?, ?, ?, ?, ?)", turns)
+            connection.executemany("INSERT OR REPLACE INTO firm_choices VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", firms)
+            connection.executemany("INSERT OR REPLACE INTO customer_choices VALUES (?, ?, ?, ?, ?, ?)", customers)
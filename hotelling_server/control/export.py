@@ -0,0 +1,244 @@
+"""Export of backups to columnar files, for analysis.
+
+Run from the repository root:
+
+    python -m hotelling_server.control.export [--csv] [--output folder] [--processes n] [file ...]
+
+Each backup (every one of the results folder if none is given) is written to
+'<output>/<backup name>.npz': a '.npy' member per entry of the history
+('history/<entry>', a row per turn) and of the current state
+('current_state/<entry>'), read back with 'numpy.load'. With '--csv', it is
+written to '<output>/<backup name>/history/<entry>.csv.gz' (a line per turn,
+after the turn number) and '<output>/<backup name>/current_state.csv.gz'
+instead. Backups are exported in parallel by a pool of processes.
+
+The history is written by chunks of turns, in bounded memory: the columns
+of the snapshot are mapped in memory rather than read (see
+'Backup.read_snapshot', or 'History' if it was spilled to files), and the
+memory of the turns of a chunk is given back once it is written. The rows
+recorded by the journal since the snapshot are read at once: there are at
+most 'snapshot_every' saves of them. Backups of the released version, a bare
+pickle, are still read whole.
+"""
+
+import argparse
+import glob
+import gzip
+import mmap
+import os
+import sys
+import time
+import zipfile
+from itertools import chain
+from multiprocessing import Pool
+from os import path, getcwd, makedirs
+
+import numpy as np
+
+from hotelling_server.control.backup import Backup
+from hotelling_server.control.state import State
+
+# Turns converted and written at once: the memory used stays the same, whatever the length of the game
+chunk = 4096
+
+
+def columns(file):
+    """(name, shape, dtype, chunks of rows) of each entry of the history, then of the current state,
+    of the data saved in 'file'"""
+
+    maps = []
+    data, journals = Backup.open_snapshot(file, maps)
+
+    if data is None:
+        raise ValueError("{} could not be read".format(file))
+
+    history = data["history"]
+    maps += history.maps.values()
+
+    # Turns recorded since the snapshot are kept apart: its history is read-only
+    recorded = {}
+
+    for changes in Backup.records(journals, data.pop("journal_seq", 0)):
+
+        for key, rows in changes.pop("history", {}).items():
+            recorded.setdefault(key, []).append(rows)
+
+        Backup.replay(data, changes)
+
+    # (address, map) of the mapped files, for giving back their pages
+    maps = [(np.frombuffer(buffer, dtype="uint8").ctypes.data, buffer) for buffer in maps if hasattr(buffer, "madvise")]
+
+    for key in history:
+
+        saved = history[key]
+        rows = np.asarray(np.concatenate(recorded[key]), dtype=saved.dtype) if key in recorded else saved[:0]
+        shape = (len(saved) + len(rows), ) + (saved.shape[1:] if len(saved) else rows.shape[1:])
+
+        yield "history/" + key, shape, saved.dtype, chain(chunks(saved, maps), chunks(rows))
+
+    current_state = data["current_state"]
+
+    if current_state is not None:
+        for key in current_state:
+            array = np.asarray(current_state[key], dtype=State.value_dtype(key))
+            yield "current_state/" + key, array.shape, array.dtype, [array]
+
+
+def chunks(array, maps=()):
+    """'array' by 'chunk' rows, the memory of each one is given back once it is written if it is mapped"""
+
+    for start in range(0, len(array), chunk):
+
+        rows = array[start:start + chunk]
+        yield rows
+
+        release(rows, maps)
+
+
+def release(rows, maps):
+
+    address = rows.ctypes.data
+
+    for base, buffer in maps:
+        if base <= address < base + len(buffer):
+
+            start = address - base
+            start -= start % mmap.PAGESIZE
+            buffer.madvise(mmap.MADV_DONTNEED, start, address - base - start + rows.nbytes)
+
+
+def write_npz(file, columns):
+
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for name, shape, dtype, rows in columns:
+            with archive.open(name + ".npy", "w", force_zip64=True) as member:
+
+                np.lib.format.write_array_header_1_0(
+                    member, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": shape})
+
+                for part in rows:
+                    member.write(np.ascontiguousarray(part).tobytes())
+
+
+def write_csv(folder, columns):
+
+    makedirs(folder + "/history", exist_ok=True)
+
+    current_state = []
+
+    for name, shape, dtype, rows in columns:
+
+        if name.startswith("current_state/"):
+            array = next(iter(rows))
+            values = array.tolist() if array.ndim else [array.item()]
+            current_state.append(",".join(str(v) for v in [name.split("/")[1]] + values))
+            continue
+
+        with gzip.open("{}/{}.csv.gz".format(folder, name), "wt") as csv:
+
+            # A column per agent, if the entry has one value per agent
+            width = shape[1] if len(shape) > 1 else 1
+            csv.write(",".join(["t"] + [str(i) for i in range(width)]) + "\n")
+
+            t = 0
+
+            for part in rows:
+                part = part.reshape(-1, width)
+                csv.write("".join(
+                    "{},{}\n".format(t + i, ",".join(str(v) for v in row)) for i, row in enumerate(part.tolist())))
+                t += len(part)
+
+    with gzip.open(folder + "/current_state.csv.gz", "wt") as csv:
+        csv.write("\n".join(current_state) + "\n")
+
+
+def export_file(file, folder, csv=False):
+    """write the data saved in the backup 'file' to 'folder', returns the path written"""
+
+    name = path.splitext(path.basename(file))[0]
+
+    if not path.exists(folder):
+        makedirs(folder)
+
+    if csv:
+        output = "{}/{}".format(folder, name)
+        write_csv(output, columns(file))
+
+    else:
+        output = "{}/{}.npz".format(folder, name)
+        write_npz(output, columns(file))
+
+    return output
+
+
+def export(args):
+    """'export_file' for a pool: (file, output or error)"""
+
+    file, folder, csv = args
+
+    try:
+        return file, export_file(file, folder, csv)
+
+    except Exception as err:
+        return file, err
+
+
+def export_files(files, folder, csv=False, processes=None):
+    """'export_file' for each file, by a pool of processes: yields (file, path written or error)
+    as they are done"""
+
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(export, [(file, folder, csv) for file in files])
+
+
+def size(output):
+
+    if path.isfile(output):
+        return path.getsize(output)
+
+    return sum(path.getsize(path.join(root, f)) for root, _, files in os.walk(output) for f in files)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export backups to columnar files.")
+    parser.add_argument("files", nargs="*", help="backups, every one of the results folder by default")
+    parser.add_argument("--output", default=getcwd() + "/results/export")
+    parser.add_argument("--csv", action="store_true", help="gzipped CSV files instead of '.npz' ones")
+    parser.add_argument("--processes", type=int, default=None, help="one per CPU by default")
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(getcwd() + "/results/xp_*.p"))
+
+    begin = time.perf_counter()
+    exported = 0
+    written = 0
+
+    # Loading the backups is logged
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+
+    try:
+        results = list(export_files(files, args.output, args.csv, args.processes))
+
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    for file, output in results:
+
+        if isinstance(output, Exception):
+            print("{}: {}".format(file, output))
+
+        else:
+            exported += 1
+            written += size(output)
+
+    elapsed = time.perf_counter() - begin
+
+    print("{}/{} backup(s) exported to {}: {:.1f} MB in {:.1f} s.".format(
+        exported, len(files), args.output, written / 2 ** 20, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
+import time
+
 import numpy as np
 from bots.local_bot_client import HotellingLocalBots
 
-from utils.utils import Logger, function_name
+from utils.utils import Logger, CommandRouter
+from hotelling_server.control.metrics import session_label
 
 
 class Game(Logger):
 
     name = "Game"
 
+    batch_prefix = "/batch/"
+    batch_separator = ";"
+
+    # Commands a client may send, with the types of their arguments. Their handlers get the name of the
+    # command first, for their replies and the state of their client
+    commands = {
+        "ask_init": (str, ),
+        "ask_customer_firm_choices": (int, int),
+        "ask_customer_choice_recording": (int, int, int, int),
+        "ask_firm_passive_opponent_choice": (int, int),
+        "ask_firm_passive_customer_choices": (int, int),
+        "ask_firm_active_choice_recording": (int, int, int, int),
+        "ask_firm_active_customer_choices": (int, int)
+    }
+
     def __init__(self, controller):
 
         # get controller attributes
@@ -30,6 +48,17 @@ class Game(Logger):
         self.interface_parameters = None
         self.unexpected_id_list = None
 
+        self.command_router = CommandRouter(self, self.commands, pass_name=True)
+
+        self.session = session_label(controller)
+        self.request_duration = controller.metrics.histogram(
+            "hotelling_request_duration_seconds", "Requests handled by the game, saves included.", ("session", ))
+        self.command_duration = controller.metrics.histogram(
+            "hotelling_command_duration_seconds", "Commands run by the game, per command.", ("session", "command"))
+        self.error_replies = controller.metrics.counter(
+            "hotelling_error_replies_total", "Error replies ('error/wait', 'error/time_is_superior'...).",
+            ("session", "reply"))
+
         # ----------------------------------- sides methods --------------------------------------#
 
     def new(self, parameters):
@@ -115,35 +144,84 @@ class Game(Logger):
 
     def handle_request(self, request):
 
+        begin = time.perf_counter()
+
         self.log("Got request: '{}'.".format(request))
         self.log("Current state: {}".format(self.time_manager.state))
 
         # save data in case server shuts down
         self.data.save()
 
+        # several commands in one request: '/batch/ask_a/0/1;ask_b/0/1'
+        if request.startswith(self.batch_prefix):
+            to_client = self.handle_batch(request[len(self.batch_prefix):].split(self.batch_separator))
+
+        else:
+            to_client = self.handle_command(request)
+
+        self.log("Reply '{}' to request '{}'.".format(to_client, request))
+
+        # save in case server shuts down
+        self.data.save()
+
+        self.request_duration.labels(self.session).observe(time.perf_counter() - begin)
+
+        return to_client
+
+    def handle_command(self, request):
+        """run a command, timed and counted by name ('unknown' for the ones that are not)"""
+
+        begin = time.perf_counter()
+
+        to_client = self.run_command(request)
+
+        command = next((i for i in request.split("/") if i != ""), "")
+        command = command if command in self.command_router else "unknown"
+        self.command_duration.labels(self.session, command).observe(time.perf_counter() - begin)
+
+        if str(to_client).startswith("error/"):
+            self.error_replies.labels(self.session, str(to_client)).inc()
+
+        return to_client
+
+    def run_command(self, request):
+
         # retrieve whole command
         whole = [i for i in request.split("/") if i != ""]
 
-        # retrieve method
-        command = eval("self.{}".format(whole[0]))
+        if not whole or whole[0] not in self.command_router:
+            return "error/unknown_command"
 
-        # retrieve method arguments
-        args = [int(a) if a.isdigit() else a for a in whole[1:]]
+        # retrieve method and its typed arguments
+        try:
+            command, args = self.command_router.resolve(whole[0], whole[1:])
+
+        except ValueError as err:
+            self.log(str(err))
+            return "error/bad_arguments"
 
         # don't launch methods if init is not done
-        if not self.data.current_state["init_done"] and command != self.ask_init:
-            to_client = "error/wait_init"
+        if not self.data.current_state["init_done"] and whole[0] != "ask_init":
+            return "error/wait_init"
 
         # regular launch method
         else:
-            to_client = command(*args)
+            return command(*args)
 
-        self.log("Reply '{}' to request '{}'.".format(to_client, request))
+    def handle_batch(self, requests):
+        """run commands in order, one reply per line.
+        Stops at the first one not getting a reply: the following ones may depend on it"""
 
-        # save in case server shuts down
-        self.data.save()
+        replies = []
 
-        return to_client
+        for request in requests:
+
+            replies.append(str(self.handle_command(request)))
+
+            if not replies[-1].startswith("reply/"):
+                break
+
+        return "\n".join(replies)
 
     # -----------------------| game sides methods |------------------------------------------- #
 
@@ -274,7 +352,7 @@ class Game(Logger):
     @staticmethod
     def reply(*args):
         return "reply/{}".format("/".join(
-            [str(a) if type(a) in (int, np.int64) else a.replace("ask", "reply") for a in args]
+            [str(a) if isinstance(a, (int, np.integer)) else a.replace("ask", "reply") for a in args]
         ))
 
     def get_all_states(self):
@@ -291,7 +369,7 @@ class Game(Logger):
 
     # -----------------------------------| init methods |--------------------------------------#
 
-    def ask_init(self, android_id):
+    def ask_init(self, command, android_id):
         
         if not self.is_ended():
 
@@ -308,17 +386,17 @@ class Game(Logger):
                 self.data.roles[game_id] = role
 
                 if role == "firm":
-                    return self.init_firms(function_name(), game_id, role)
+                    return self.init_firms(command, game_id, role)
 
                 else:
-                    return self.init_customers(function_name(), game_id, role)
+                    return self.init_customers(command, game_id, role)
 
             else:
                 return "Error with ID manager. Maybe not authorized to participate."
         else:
             return "Game ended. Connection refused"
 
-    def init_customers(self, func_name, game_id, role):
+    def init_customers(self, command, game_id, role):
 
         if game_id not in self.data.customers_id.keys():
             customer_id = len(self.data.customers_id)
@@ -331,10 +409,10 @@ class Game(Logger):
 
         self.check_remaining_agents()
 
-        self.set_state(role="customer", role_id=customer_id, state=function_name())
+        self.set_state(role="customer", role_id=customer_id, state="init_customers")
 
         return self.reply(
-            func_name, game_id, self.time_manager.t, role, position, exploration_cost,
+            command, game_id, self.time_manager.t, role, position, exploration_cost,
             utility_consumption, utility)
 
     def get_customers_data(self, customer_id):
@@ -346,7 +424,7 @@ class Game(Logger):
 
         return position, exploration_cost, utility_consumption, utility
 
-    def init_firms(self, func_name, game_id, role):
+    def init_firms(self, command, game_id, role):
 
         if game_id not in self.data.firms_id.keys():
             firm_id = len(self.data.firms_id)
@@ -360,9 +438,9 @@ class Game(Logger):
 
         self.check_remaining_agents()
 
-        self.set_state(role="firm", role_id=firm_id, state=function_name())
+        self.set_state(role="firm", role_id=firm_id, state="init_firms")
 
-        return self.reply(func_name, game_id, self.time_manager.t, role, position, state, price,
+        return self.reply(command, game_id, self.time_manager.t, role, position, state, price,
                           opp_position, opp_price, profits)
 
     def get_firms_data(self, firm_id):
@@ -381,7 +459,7 @@ class Game(Logger):
 
     # -----------------------------------| customer demands |--------------------------------------#
 
-    def ask_customer_firm_choices(self, game_id, t):
+    def ask_customer_firm_choices(self, command, game_id, t):
 
         customer_id = self.data.customers_id[game_id]
 
@@ -393,9 +471,9 @@ class Game(Logger):
 
                 x, prices = self.get_prices_and_positions()
 
-                self.set_state(role="customer", role_id=customer_id, state=function_name())
+                self.set_state(role="customer", role_id=customer_id, state=command)
 
-                return self.reply(function_name(), self.time_manager.t, x[0], x[1], prices[0], prices[1])
+                return self.reply(command, self.time_manager.t, x[0], x[1], prices[0], prices[1])
             else:
                 return "error/wait"
 
@@ -406,9 +484,9 @@ class Game(Logger):
             x = self.data.history["firm_positions"][t]
             prices = self.data.history["firm_prices"][t]
 
-            return self.reply(function_name(), t, x[0], x[1], prices[0], prices[1])
+            return self.reply(command, t, x[0], x[1], prices[0], prices[1])
 
-    def ask_customer_choice_recording(self, game_id, t, extra_view, firm):
+    def ask_customer_choice_recording(self, command, game_id, t, extra_view, firm):
 
         customer_id = self.data.customers_id[game_id]
 
@@ -418,7 +496,7 @@ class Game(Logger):
 
         if t == self.time_manager.t:
 
-            out = self.reply(function_name(), self.time_manager.t, self.check_end(t))
+            out = self.reply(command, self.time_manager.t, self.check_end(t))
 
             if not self.data.current_state["customer_replies"][customer_id]:
 
@@ -429,7 +507,7 @@ class Game(Logger):
                 self.log("Customer {} asks for recording his choice as t {} but already replied"
                          .format(game_id, t, extra_view, firm))
 
-            state = "end_game" if self.check_end(t) else function_name()
+            state = "end_game" if self.check_end(t) else command
             self.set_state(role="customer", role_id=customer_id, state=state)
 
             return out
@@ -438,11 +516,11 @@ class Game(Logger):
             return "error/time_is_superior"
 
         else:
-            return self.reply(function_name(), t, self.check_end(t))
+            return self.reply(command, t, self.check_end(t))
 
     # ----------------------------------| passive firm demands |-------------------------------------- #
 
-    def ask_firm_passive_opponent_choice(self, game_id, t):
+    def ask_firm_passive_opponent_choice(self, command, game_id, t):
         """called by a passive firm"""
 
         firm_id = self.data.firms_id[game_id]
@@ -456,14 +534,14 @@ class Game(Logger):
                     self.time_manager.state == "active_has_played_and_all_customers_replied":
 
                 out = self.reply(
-                    function_name(),
+                    command,
                     self.time_manager.t,
                     self.data.current_state["firm_positions"][opponent_id],
                     self.data.current_state["firm_prices"][opponent_id],
                 )
 
                 self.time_manager.check_state()
-                self.set_state(role="firm", role_id=firm_id, state=function_name())
+                self.set_state(role="firm", role_id=firm_id, state=command)
 
                 return out
 
@@ -476,13 +554,13 @@ class Game(Logger):
         else:
 
             return self.reply(
-                function_name(),
+                command,
                 t,
                 self.data.history["firm_positions"][t][opponent_id],
                 self.data.history["firm_prices"][t][opponent_id],
             )
 
-    def ask_firm_passive_customer_choices(self, game_id, t):
+    def ask_firm_passive_customer_choices(self, command, game_id, t):
 
         firm_id = self.data.firms_id[game_id]
 
@@ -497,11 +575,11 @@ class Game(Logger):
 
                     choices = self.get_client_choices(firm_id, t)
 
-                    out = self.reply(function_name(), self.time_manager.t, choices, self.check_end(t))
+                    out = self.reply(command, self.time_manager.t, choices, self.check_end(t))
                     
                     self.firm_end_of_turn(firm_id=firm_id, t=t, status="passive")
 
-                    state = "end_game" if self.check_end(t) else function_name()
+                    state = "end_game" if self.check_end(t) else command
                     self.set_state(role="firm", role_id=firm_id, state=state)
 
                     self.time_manager.check_state()
@@ -516,11 +594,11 @@ class Game(Logger):
 
         else:
             choices = self.get_client_choices(firm_id, t)
-            return self.reply(function_name(), t, choices, self.check_end(t))
+            return self.reply(command, t, choices, self.check_end(t))
 
     # -----------------------------------| active firm demands |-------------------------------------- #
 
-    def ask_firm_active_choice_recording(self, game_id, t, position, price):
+    def ask_firm_active_choice_recording(self, command, game_id, t, position, price):
         """called by active firm"""
 
         firm_id = self.data.firms_id[game_id]
@@ -530,13 +608,13 @@ class Game(Logger):
 
         if t == self.time_manager.t:
 
-            out = self.reply(function_name(), self.time_manager.t)
+            out = self.reply(command, self.time_manager.t)
 
             if not self.data.current_state["active_replied"]:
 
-                self.firm_active_first_step(firm_id, price, position, function_name())
+                self.firm_active_first_step(firm_id, price, position, command)
 
-                self.set_state(role="firm", role_id=firm_id, state=function_name())
+                self.set_state(role="firm", role_id=firm_id, state=command)
 
                 self.time_manager.check_state()
 
@@ -546,9 +624,9 @@ class Game(Logger):
             return "error/time_is_superior"
 
         else:
-            return self.reply(function_name(), t)
+            return self.reply(command, t)
 
-    def ask_firm_active_customer_choices(self, game_id, t):
+    def ask_firm_active_customer_choices(self, command, game_id, t):
         """called by active firm"""
 
         firm_id = self.data.firms_id[game_id]
@@ -562,11 +640,11 @@ class Game(Logger):
 
                 choices = self.get_client_choices(firm_id, t)
 
-                out = self.reply(function_name(), self.time_manager.t, choices, self.check_end(t))
+                out = self.reply(command, self.time_manager.t, choices, self.check_end(t))
 
                 self.firm_end_of_turn(firm_id=firm_id, t=t, status="active")
                 
-                state = "end_game" if self.check_end(t) else function_name()
+                state = "end_game" if self.check_end(t) else command
                 self.set_state(role="firm", role_id=firm_id, state=state)
 
                 self.time_manager.check_state()
@@ -581,4 +659,4 @@ class Game(Logger):
 
         else:
             choices = self.get_client_choices(firm_id, t)
-            return self.reply(function_name(), t, choices, self.check_end(t))
+            return self.reply(command, t, choices, self.check_end(t))
@@ -0,0 +1,181 @@
+from os import path, makedirs
+import mmap
+import numpy as np
+
+
+class History:
+    """one numpy array per entry, holding a row per turn, allocated ahead and grown geometrically.
+    'history[key]' is a view on the turns recorded so far: 'history[key][t]' is the row of turn t,
+    'history[key][t0:t1]' the rows of a range of turns, without any copy.
+
+    With a 'folder', arrays are memory-mapped files of this folder (one per entry): the OS pages
+    out the rows of past turns, and gets them back when they are read"""
+
+    # Turns allocated at first
+    capacity = 64
+
+    # Spilled to files, the memory of the rows older than the last 'resident' turns is given back
+    # each time 'resident' more turns are recorded
+    resident = 1024
+
+    def __init__(self, dtypes, folder=None):
+
+        # key: dtype of the entry, the shape of a row is the one of the first row appended
+        self.dtypes = dtypes
+        self.folder = folder
+
+        self.columns = {}
+        self.maps = {}  # key: memory map of the file of the entry, if spilled
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(self.dtypes)
+
+    def __contains__(self, key):
+        return key in self.dtypes
+
+    def keys(self):
+        return self.dtypes.keys()
+
+    def __getitem__(self, key):
+
+        if key not in self.columns:
+            return np.empty(0, dtype=self.dtypes[key])
+
+        return self.columns[key][:self.n]
+
+    def append(self, row):
+        """'row': the value of each entry for one more turn"""
+
+        self.extend({key: [value] for key, value in row.items()})
+
+    def extend(self, rows):
+        """'rows': for each entry, its values for the same number of turns"""
+
+        n_rows = len(next(iter(rows.values()))) if rows else 0
+
+        for key, values in rows.items():
+
+            values = np.asarray(values, dtype=self.dtypes[key])
+
+            if key not in self.columns:
+                self.columns[key] = self.allocate(key, (max(self.capacity, 2 * n_rows), ) + values.shape[1:])
+
+            column = self.columns[key]
+
+            if self.n + n_rows > len(column):
+                column = self.allocate(key, (max(2 * len(column), self.n + n_rows), ) + column.shape[1:])
+                self.columns[key] = column
+
+            column[self.n:self.n + n_rows] = values
+
+        if self.maps and (self.n + n_rows) // self.resident > self.n // self.resident:
+            self.release()
+
+        self.n += n_rows
+
+    def allocate(self, key, shape):
+        """array of 'shape' for an entry, holding the rows recorded so far"""
+
+        if self.folder is not None:
+            return self.map(key, shape)
+
+        column = np.zeros(shape, dtype=self.dtypes[key])
+
+        if key in self.columns:
+            column[:self.n] = self.columns[key][:self.n]
+
+        return column
+
+    def file(self, key):
+        return "{}/{}.dat".format(self.folder, key)
+
+    def map(self, key, shape):
+        """array of the file of an entry, the file is made as long as 'shape' if it is shorter"""
+
+        dtype = np.dtype(self.dtypes[key])
+        size = int(np.prod(shape)) * dtype.itemsize
+
+        if not path.exists(self.folder):
+            makedirs(self.folder)
+
+        with open(self.file(key), "ab") as file:
+            if file.tell() < size:
+                file.truncate(size)
+
+        with open(self.file(key), "r+b") as file:
+            self.maps[key] = mmap.mmap(file.fileno(), 0)
+
+        # Arrays read before keep the former map alive
+        return np.frombuffer(self.maps[key], dtype=dtype).reshape((-1, ) + tuple(shape[1:]))
+
+    def release(self):
+        """write the rows to the files, and let the OS take back the memory of the ones of
+        the turns before the last 'resident' ones"""
+
+        for key, buffer in self.maps.items():
+
+            buffer.flush()
+
+            end = (self.n - self.resident) * self.columns[key].strides[0]
+            end -= end % mmap.PAGESIZE
+
+            if end > 0 and hasattr(buffer, "madvise"):
+                buffer.madvise(mmap.MADV_DONTNEED, 0, end)
+
+    def rows(self, start):
+        """copy of the rows of each entry from turn 'start'"""
+
+        return {key: column[start:self.n].copy() for key, column in self.columns.items()} \
+            if start < self.n else {}
+
+    def __copy__(self):
+        """the turns recorded so far: they are never written again, so the copy shares them"""
+
+        history = History(self.dtypes, self.folder)
+        history.columns = dict(self.columns)
+        history.maps = dict(self.maps)
+        history.n = self.n
+
+        return history
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def __getstate__(self):
+
+        # Spilled, rows are in the files once flushed: only where to find them is saved
+        if self.folder is not None:
+
+            for buffer in self.maps.values():
+                buffer.flush()
+
+            return {"dtypes": self.dtypes, "n": self.n, "folder": self.folder,
+                    "row_shapes": {key: column.shape[1:] for key, column in self.columns.items()}}
+
+        # Turns allocated ahead are not worth saving
+        return {"dtypes": self.dtypes, "n": self.n, "folder": None,
+                "columns": {key: column[:self.n] for key, column in self.columns.items()}}
+
+    def __setstate__(self, state):
+
+        self.__init__(state["dtypes"], state.get("folder"))
+        self.n = state["n"]
+
+        if self.folder is None:
+            self.columns = state["columns"]
+
+        else:
+            self.columns = {key: self.map(key, (self.n, ) + tuple(shape)) for key, shape in state["row_shapes"].items()}
+
+    @classmethod
+    def from_lists(cls, dtypes, lists):
+        """history as it was saved before: lists of rows per entry"""
+
+        history = cls(dtypes)
+        history.extend({key: rows for key, rows in lists.items() if len(rows)})
+
+        return history
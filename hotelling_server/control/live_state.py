@@ -0,0 +1,291 @@
+import pickle
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from threading import Lock
+
+import numpy as np
+
+from utils.utils import Logger
+from hotelling_server.control.state import State
+
+
+class Block:
+    """layout of the shared memory of a session: a header, the buffer of its current state (see
+    'State'), then the pickle of the other values monitored ('extras').
+
+    'seq' is odd while the block is written (seqlock): a reader reads 'seq', the values, then 'seq'
+    again, and the values are consistent if it is even and did not change"""
+
+    # seq, replaced, t, n_firms, n_customers, size of the state, size of the extras
+    header = struct.Struct("<QQqIIII")
+
+    # The state starts aligned for its widest values
+    state_offset = 64
+
+    extras_size = 2 ** 16
+
+    @staticmethod
+    def name(port, session_id):
+        return "hotelling_{}_{}".format(port, "default" if session_id is None else session_id)
+
+    @classmethod
+    def size(cls, state_size):
+        return cls.state_offset + state_size + cls.extras_size
+
+    def __init__(self, memory):
+
+        self.memory = memory
+        self.seq = np.ndarray(1, dtype="uint64", buffer=memory.buf)
+        self.replaced = np.ndarray(1, dtype="uint64", buffer=memory.buf, offset=8)
+
+    def read_header(self):
+        return self.header.unpack_from(self.memory.buf)[2:]
+
+    def close(self):
+
+        # Views on the memory go first
+        self.seq = self.replaced = None
+
+        # States read with 'state' may still use it: it is unmapped once they are gone
+        try:
+            self.memory.close()
+        except BufferError:
+            pass
+
+    def state(self):
+        """the current state, as a view on the block"""
+
+        t, n_firms, n_customers, state_size, extras_size = self.read_header()
+
+        return State(n_firms, n_customers, buffer=np.ndarray(
+            state_size, dtype="uint8", buffer=self.memory.buf, offset=self.state_offset))
+
+
+# Names of the blocks made by this process
+made = set()
+
+
+def attach(name):
+    """the shared memory of another process, or of a 'LiveState' of this one: it is the one to remove it"""
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+
+    # Before Python 3.13, the memory is tracked, and removed when this process ends
+    except TypeError:
+        memory = shared_memory.SharedMemory(name)
+
+        # Tracked once by name: the 'LiveState' which made it still removes it
+        if name not in made:
+            resource_tracker.unregister(memory._name, "shared_memory")
+
+        return memory
+
+
+class LiveState(Logger):
+    """the current state of a session, its turn, time manager state, roles and figures, published in
+    shared memory at each save (see 'Data.save'), for monitors in other processes (see 'LiveReader').
+    The game thread only copies the state buffer, and pickles the other values when they change"""
+
+    name = "LiveState"
+
+    def __init__(self, controller):
+
+        self.controller = controller
+        self.session_id = getattr(controller, "session_id", None)
+
+        self.block = None
+
+        # Last extras published
+        self.extras = None
+
+        # Saves come from the controller and from the local bots: the block has a single writer at a time
+        self.lock = Lock()
+
+    @property
+    def block_name(self):
+        return Block.name(self.controller.data.param["network"]["port"], self.session_id)
+
+    def allocate(self, state_size):
+
+        # Readers attach to the new block
+        self.release()
+
+        try:
+            memory = shared_memory.SharedMemory(self.block_name, create=True, size=Block.size(state_size))
+
+        # Left by a process which stopped without removing it
+        except FileExistsError:
+            former = shared_memory.SharedMemory(self.block_name)
+            former.close()
+            former.unlink()
+            memory = shared_memory.SharedMemory(self.block_name, create=True, size=Block.size(state_size))
+
+        made.add(self.block_name)
+
+        self.block = Block(memory)
+        self.extras = None
+
+    def publish(self):
+
+        with self.lock:
+            self.write()
+
+    def write(self):
+
+        state = self.controller.data.current_state
+
+        if state is None:
+            return
+
+        if self.block is None or self.block.read_header()[1:3] != state.shape:
+            self.allocate(len(state.buffer))
+
+        extras = {
+            "time_manager_state": self.controller.time_manager.state,
+            "roles": list(self.controller.data.roles),
+            "statistics": self.controller.statistician.data
+        }
+
+        pickled = None
+
+        # The figures are replaced each turn, the other values seldom change
+        if self.extras is None or \
+                any(extras[k] != self.extras[k] for k in ("time_manager_state", "roles")) or \
+                extras["statistics"] is not self.extras["statistics"]:
+
+            pickled = pickle.dumps(
+                dict(extras, statistics={k: v if k not in ("running", "rolling") else dict(v)
+                                         for k, v in extras["statistics"].items()}),
+                protocol=pickle.HIGHEST_PROTOCOL)
+
+            if len(pickled) > Block.extras_size:
+                self.log("Values monitored are too big ({} bytes), they are not published.".format(len(pickled)))
+                pickled = None
+
+            self.extras = extras
+
+        block = self.block
+        buffer = block.memory.buf
+
+        block.seq[0] += 1
+
+        extras_size = block.read_header()[4] if pickled is None else len(pickled)
+        Block.header.pack_into(
+            buffer, 0, int(block.seq[0]), 0, self.controller.time_manager.t, *state.shape, len(state.buffer),
+            extras_size)
+
+        start = Block.state_offset
+        buffer[start:start + len(state.buffer)] = state.buffer.data
+
+        if pickled is not None:
+            start += len(state.buffer)
+            buffer[start:start + len(pickled)] = pickled
+
+        block.seq[0] += 1
+
+    def close(self):
+
+        with self.lock:
+            self.release()
+
+    def release(self):
+        """remove the block, readers still attached to it see it is replaced"""
+
+        if self.block is not None:
+
+            self.block.replaced[0] = 1
+            self.block.close()
+            self.block.memory.unlink()
+            made.discard(self.block_name)
+            self.block = None
+
+
+class LiveReader(Logger):
+    """reads what a 'LiveState' of another process publishes, without any exchange with it"""
+
+    name = "LiveReader"
+
+    # Seconds between tries while the block is written
+    retry = 0.0001
+
+    # Seconds a replaced block is waited for: the session may be closed
+    reattach_timeout = 1
+
+    def __init__(self, port, session_id=None):
+
+        self.block_name = Block.name(port, session_id)
+        self.block = Block(attach(self.block_name))
+
+        # Extras of the last read, unpickled again only if they changed
+        self.extras = (None, None)
+
+        # Version of the block of the last read
+        self.seq = None
+
+    def begin(self):
+        """version of the block, once it is not written: the values read from 'state' are consistent
+        if 'valid' still holds for this version after reading them"""
+
+        if self.block.replaced[0]:
+            memory = self.reattach()
+            self.block.close()
+            self.block = Block(memory)
+
+        while True:
+            seq = int(self.block.seq[0])
+
+            if not seq % 2:
+                return seq
+
+            time.sleep(self.retry)
+
+    def reattach(self):
+        """raises FileNotFoundError if no block replaces the former one"""
+
+        deadline = time.time() + self.reattach_timeout
+
+        # The new block may not be made yet
+        while True:
+            try:
+                return attach(self.block_name)
+
+            except FileNotFoundError:
+                if time.time() > deadline:
+                    raise
+
+                time.sleep(self.retry)
+
+    def valid(self, seq):
+        return int(self.block.seq[0]) == seq and not self.block.replaced[0]
+
+    def state(self):
+        """view on the current state in the block: no copy, see 'begin'"""
+
+        return self.block.state()
+
+    def read(self):
+        """consistent copy of the values published: 'current_state', 'time_manager_t',
+        'time_manager_state', 'roles' and 'statistics'"""
+
+        while True:
+            seq = self.begin()
+
+            t, n_firms, n_customers, state_size, extras_size = self.block.read_header()
+            state = self.block.state().copy()
+
+            start = Block.state_offset + state_size
+            extras = bytes(self.block.memory.buf[start:start + extras_size])
+
+            if self.valid(seq):
+                self.seq = seq
+                break
+
+        if extras != self.extras[0]:
+            self.extras = (extras, pickle.loads(extras) if extras else {})
+
+        return dict(self.extras[1], current_state=state, time_manager_t=t)
+
+    def close(self):
+        self.block.close()
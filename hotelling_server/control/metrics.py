@@ -0,0 +1,189 @@
+import bisect
+from threading import Lock
+
+from utils.utils import Logger
+
+
+# Upper bounds of the buckets of histograms of durations (seconds)
+request_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5)
+state_buckets = (0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60., 120., 300., 600.)
+
+
+class Value:
+    """value of a counter or a gauge for one set of labels. A gauge may instead be read from a
+    function, called when the metrics are exported"""
+
+    def __init__(self):
+
+        self.value = 0
+        self.function = None
+        self.lock = Lock()
+
+    def inc(self, amount=1):
+
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self, name, labels):
+
+        value = self.value if self.function is None else self.function()
+        yield name, labels, value
+
+
+class Buckets:
+    """values of a histogram for one set of labels: the count of observations in each bucket, their
+    sum and count"""
+
+    def __init__(self, bounds):
+
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.
+        self.count = 0
+        self.lock = Lock()
+
+    def observe(self, value):
+
+        i = bisect.bisect_left(self.bounds, value)
+
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+            count = self.count
+
+        cumulative = 0
+
+        for bound, n in zip(self.bounds + (float("inf"), ), counts):
+            cumulative += n
+            yield name + "_bucket", labels + (("le", bound), ), cumulative
+
+        yield name + "_sum", labels, total
+        yield name + "_count", labels, count
+
+
+class Metric:
+    """a metric and its values, one for each set of values of its labels ('labels')"""
+
+    def __init__(self, kind, name, description, labels=(), buckets=None):
+
+        self.kind = kind
+        self.name = name
+        self.description = description
+        self.label_names = labels
+        self.buckets = buckets
+
+        # key: values of the labels
+        self.values = {}
+        self.lock = Lock()
+
+    def labels(self, *values):
+
+        value = self.values.get(values)
+
+        if value is None:
+            with self.lock:
+                value = self.values.setdefault(values, Buckets(self.buckets) if self.kind == "histogram" else Value())
+
+        return value
+
+    def render(self):
+
+        lines = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} {}".format(self.name, self.kind)
+        ]
+
+        # Children are added from other threads while rendering
+        with self.lock:
+            items = list(self.values.items())
+
+        for values, value in sorted(items, key=str):
+            for name, labels, sample in value.samples(self.name, tuple(zip(self.label_names, values))):
+                lines.append("{}{} {}".format(name, format_labels(labels), format_value(sample)))
+
+        return lines
+
+
+def format_labels(labels):
+
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{}="{}"'.format(key, format_label_value(value)) for key, value in labels) + "}"
+
+
+def format_label_value(value):
+
+    if isinstance(value, float):
+        return format_value(value)
+
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry(Logger):
+    """metrics of a controller and its sessions, exported in the text format of Prometheus (see
+    'MonitorServer'). Recording a value only takes a dict lookup and a lock: the metrics are always on.
+    Sessions share the metrics of their controller, the 'session' label tells them apart"""
+
+    name = "Registry"
+
+    def __init__(self):
+
+        # key: name of the metric
+        self.metrics = {}
+        self.lock = Lock()
+
+    def get(self, kind, name, description, labels, buckets=None):
+        """the metric 'name', made the first time it is asked for"""
+
+        with self.lock:
+
+            if name not in self.metrics:
+                self.metrics[name] = Metric(kind, name, description, labels, buckets)
+
+            return self.metrics[name]
+
+    def counter(self, name, description, labels=()):
+        return self.get("counter", name, description, labels)
+
+    def gauge(self, name, description, labels=()):
+        return self.get("gauge", name, description, labels)
+
+    def histogram(self, name, description, labels=(), buckets=request_buckets):
+        return self.get("histogram", name, description, labels, buckets)
+
+    def render(self):
+
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+def session_label(controller):
+    """value of the 'session' label for the components of a controller or a session"""
+
+    session_id = getattr(controller, "session_id", None)
+
+    return "default" if session_id is None else str(session_id)
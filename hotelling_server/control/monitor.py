@@ -0,0 +1,172 @@
+import http.server
+import json
+import time
+from threading import Thread, Lock
+
+import numpy as np
+
+from utils.utils import Logger
+from hotelling_server.control.live_state import LiveReader
+
+
+class MonitorHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        status, body, content_type = self.server.monitor.handle(self.path.partition("?")[0])
+
+        self.send_response(status)
+        self.send_header("Content-type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        return
+
+
+class MonitorServer(Thread, Logger):
+    """read-only HTTP endpoint for operators, on a port of its own. Sessions are read from what their
+    'LiveState' publishes (see 'LiveReader'), client timings from a copy of 'Server.clients': polling
+    it neither goes through the queue of the controller nor saves anything.
+
+    GET /sessions: ids of the sessions published ('default' for the controller's own one)
+    GET /state/<session_id>: current state, turn, time manager state, roles and figures of a session
+    GET /clients: time since the last request of each client
+    GET /metrics: the metrics of the controller and its sessions, in the text format of Prometheus"""
+
+    name = "MonitorServer"
+
+    json_type = "application/json"
+    metrics_type = "text/plain; version=0.0.4"
+
+    def __init__(self, controller, port):
+
+        super().__init__(daemon=True)
+
+        self.cont = controller
+        self.port = port
+
+        # key: session id, value: its reader
+        self.readers = {}
+
+        # key: session id, value: (version of the block, response): sessions which did not change
+        # since they were last asked for are not encoded again
+        self.responses = {}
+
+        # Requests are handled in threads of their own
+        self.lock = Lock()
+
+        self.http_server = None
+
+    def run(self):
+
+        self.http_server = http.server.ThreadingHTTPServer(("localhost", self.port), MonitorHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.monitor = self
+
+        self.log("Monitoring on port {}.".format(self.port))
+
+        self.http_server.serve_forever()
+
+    def shutdown(self):
+
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+
+        with self.lock:
+            for reader in self.readers.values():
+                reader.close()
+
+            self.readers.clear()
+
+    def handle(self, path):
+        """(status, body, content type) of the response to a request path"""
+
+        parts = [p for p in path.split("/") if p]
+
+        if parts == ["metrics"]:
+            return 200, self.cont.metrics.render().encode(), self.metrics_type
+
+        elif parts == ["sessions"]:
+            return 200, self.encode(self.session_ids()), self.json_type
+
+        elif parts == ["clients"]:
+            return 200, self.encode(self.clients()), self.json_type
+
+        elif len(parts) in (1, 2) and parts[0] == "state":
+
+            session_id = parts[1] if len(parts) == 2 else "default"
+
+            if session_id not in self.session_ids():
+                return 404, self.encode({"error": "unknown session '{}'".format(session_id)}), self.json_type
+
+            response = self.state(session_id)
+
+            if response is None:
+                return 404, self.encode({"error": "session '{}' is not published yet".format(session_id)}), \
+                    self.json_type
+
+            return 200, response, self.json_type
+
+        return 404, self.encode({"error": "unknown path '{}'".format(path)}), self.json_type
+
+    def session_ids(self):
+        return ["default"] + list(getattr(self.cont, "sessions", {}))
+
+    def state(self, session_id):
+
+        with self.lock:
+
+            if session_id not in self.readers:
+                try:
+                    self.readers[session_id] = LiveReader(
+                        self.cont.data.param["network"]["port"], None if session_id == "default" else session_id)
+
+                # Nothing saved yet
+                except FileNotFoundError:
+                    return
+
+            reader = self.readers[session_id]
+
+            # The session was closed
+            try:
+                values = reader.read()
+
+            except FileNotFoundError:
+                self.readers.pop(session_id).close()
+                return
+
+            version, response = self.responses.get(session_id, (None, None))
+
+            if version != reader.seq:
+
+                current_state = values["current_state"]
+
+                response = self.encode(dict(
+                    values,
+                    current_state={key: self.to_json(current_state[key]) for key in current_state}))
+
+                self.responses[session_id] = reader.seq, response
+
+            return response
+
+    def clients(self):
+
+        now = time.time()
+
+        # Entries are replaced rather than modified, see 'Server.check_client_connection'
+        return {
+            ip: dict(client, time_since_last_request=now - client["time"])
+            for ip, client in dict(self.cont.server.clients).items()
+        }
+
+    @staticmethod
+    def to_json(value):
+        return value if isinstance(value, bool) else np.asarray(value).tolist()
+
+    @staticmethod
+    def encode(value):
+        return json.dumps(value).encode()
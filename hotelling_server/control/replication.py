@@ -0,0 +1,242 @@
+import copy
+import pickle
+import socket
+import time
+import zlib
+from threading import Thread, Lock
+
+from utils.utils import Logger
+from hotelling_server.control.backup import Backup
+
+
+class Replica:
+    """connection to a standby process. Frames sent are pickles of (session_id, payload), preceded
+    by their size and crc32 as journal records. 'payload' is the pickle of the whole data of a session
+    ('journal_seq' is its version), of the changes of one save ('seq' is its version), or None for
+    a heartbeat"""
+
+    # A standby not reading for that long (seconds) is dropped: saves must not wait for it
+    send_timeout = 5
+
+    def __init__(self, connection, address):
+
+        self.connection = connection
+        self.connection.settimeout(self.send_timeout)
+        self.address = address
+
+        # Saves of several sessions are sent from several threads
+        self.lock = Lock()
+        self.alive = True
+
+    def send(self, session_id, payload):
+
+        message = pickle.dumps((session_id, payload), protocol=pickle.HIGHEST_PROTOCOL)
+
+        with self.lock:
+
+            if not self.alive:
+                return
+
+            try:
+                self.connection.sendall(Backup.header.pack(len(message), zlib.crc32(message)) + message)
+
+            # A frame sent in part leaves the stream unreadable
+            except (socket.timeout, OSError):
+                self.alive = False
+                self.connection.close()
+
+
+class ReplicationServer(Thread, Logger):
+    """sends the saves of the backups of this process to standby processes, see 'Standby'.
+    A standby gets the whole data of each backup, then the changes of each save, sent as the save
+    is made: a reply is never sent before the standby may get the save it follows"""
+
+    name = "ReplicationServer"
+
+    # Seconds between heartbeats
+    heartbeat = 0.2
+
+    def __init__(self, port):
+
+        super().__init__(daemon=True)
+
+        self.port = port
+        self.backups = []
+
+    def add(self, backup):
+        self.backups.append(backup)
+
+    def remove(self, backup):
+
+        if backup in self.backups:
+            self.backups.remove(backup)
+
+    def run(self):
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("localhost", self.port))
+        sock.listen(4)
+        sock.settimeout(self.heartbeat)
+
+        self.log("Waiting for standby processes on port {}.".format(self.port))
+
+        replicas = []
+
+        while True:
+
+            try:
+                connection, address = sock.accept()
+
+            except socket.timeout:
+                pass
+
+            else:
+                self.log("Standby {} connected.".format(address))
+                replica = Replica(connection, address)
+                self.follow(replica)
+                replicas.append(replica)
+
+            for replica in replicas:
+                replica.send(None, None)
+
+            for replica in [r for r in replicas if not r.alive]:
+                self.log("Standby {} lost.".format(replica.address))
+                replicas.remove(replica)
+
+                for backup in list(self.backups):
+                    if replica in backup.replicas:
+                        backup.replicas.remove(replica)
+
+    def follow(self, replica):
+        """the standby gets the data of each backup, then the saves following"""
+
+        for backup in list(self.backups):
+
+            # A save is sent either in the data or after it
+            with backup.lock:
+
+                if backup.shadow is not None:
+                    data = dict(copy.deepcopy(backup.shadow), journal_seq=backup.seq)
+                    replica.send(backup.session_id, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+                backup.replicas.append(replica)
+
+
+class Standby(Logger):
+    """process following the saves of the primary one (its 'ReplicationServer'). If the primary
+    stops, or says nothing for 'timeout' seconds, it takes over: a controller resumes each
+    session where it was left, and serves on the port of the primary"""
+
+    name = "Standby"
+
+    timeout = 1
+
+    # Seconds between tries to reach the primary, or its port
+    retry = 0.1
+
+    def __init__(self, port, server_address):
+
+        self.port = port
+        self.server_address = server_address
+
+        # session_id: data, and its version
+        self.replicas = {}
+        self.seq = {}
+
+    def run(self):
+
+        from hotelling_server.controller import Controller
+
+        # Ready to take over
+        controller = Controller(model=None, default_session=False)
+
+        connection = self.connect()
+        connection.settimeout(self.timeout)
+
+        self.log("Following the primary.")
+
+        try:
+            while True:
+                session_id, payload = self.receive(connection)
+
+                if payload is not None:
+                    self.apply(session_id, pickle.loads(payload))
+
+        except (OSError, EOFError, ValueError) as err:
+            self.log("Primary lost ({}).".format(err or type(err).__name__))
+
+        connection.close()
+
+        self.take_over(controller)
+
+    def connect(self):
+
+        while True:
+            try:
+                return socket.create_connection(("localhost", self.port))
+
+            except ConnectionRefusedError:
+                time.sleep(self.retry)
+
+    def receive(self, connection):
+
+        header = self.read(connection, Backup.header.size)
+        size, crc = Backup.header.unpack(header)
+        message = self.read(connection, size)
+
+        if zlib.crc32(message) != crc:
+            raise ValueError("damaged frame")
+
+        return pickle.loads(message)
+
+    @staticmethod
+    def read(connection, size):
+
+        data = b""
+
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+
+            if not chunk:
+                raise EOFError("connection closed")
+
+            data += chunk
+
+        return data
+
+    def apply(self, session_id, changes):
+
+        if "journal_seq" in changes:
+            self.seq[session_id] = changes.pop("journal_seq")
+            self.replicas[session_id] = changes
+
+        elif session_id in self.replicas and changes["seq"] == self.seq[session_id] + 1:
+            Backup.replay(self.replicas[session_id], changes)
+            self.seq[session_id] = changes["seq"]
+
+        else:
+            self.log("Save {} of session '{}' is out of order.".format(changes["seq"], session_id))
+
+    def take_over(self, controller):
+
+        # A primary which hangs still holds its port
+        while True:
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind(self.server_address)
+                sock.close()
+                break
+
+            except OSError:
+                sock.close()
+                time.sleep(self.retry)
+
+        self.log("Taking over at version {}.".format(self.seq))
+
+        controller.replica = self.replicas.pop(None, None)
+        controller.start()
+
+        for session_id, data in self.replicas.items():
+            controller.queue.put(("resume_session", session_id, data))
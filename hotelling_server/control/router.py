@@ -0,0 +1,297 @@
+import asyncio
+import bisect
+import hashlib
+import socket
+import time
+from multiprocessing import Process, Event
+
+from utils.utils import Logger
+from hotelling_server.control.async_server import AsyncGamingServer
+from hotelling_server.control.session import split_session_id
+
+
+class HashRing:
+    """consistent hashing of session ids on workers: adding a worker
+    only moves the sessions this worker takes over"""
+
+    # Points per worker on the ring, for an even share of the sessions
+    replicas = 64
+
+    def __init__(self, nodes):
+
+        points = sorted((self.hash("{}#{}".format(node, i)), node) for node in nodes for i in range(self.replicas))
+
+        self.keys = [key for key, node in points]
+        self.nodes = [node for key, node in points]
+
+    @staticmethod
+    def hash(key):
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+    def get(self, key):
+        return self.nodes[bisect.bisect(self.keys, self.hash(key)) % len(self.keys)]
+
+
+def run_worker(port, default_session, stop, monitor_port=0):
+    """a whole 'Controller' stack serving on a local port, monitored on 'monitor_port' (0: not monitored).
+    It is closed as it is by its own interface once 'stop' is set: saves are written, sessions closed"""
+
+    from hotelling_server.controller import Controller
+
+    controller = Controller(
+        model=None, default_session=default_session,
+        network={"local": True, "port": port, "front_end": "asyncio", "n_workers": 0, "replication_port": 0,
+                 "monitor_port": monitor_port})
+
+    controller.start()
+
+    try:
+        while not stop.wait(1) and controller.is_alive():
+            pass
+
+    # Ctrl-C reaches the workers as well as the router
+    except KeyboardInterrupt:
+        pass
+
+    controller.queue.put(("close_window", ))
+    controller.join()
+
+
+class Router(Logger):
+    """accepts the client connections and forwards the requests of each session
+    to the worker process hosting it. The default session is hosted by the first worker.
+
+    Workers are not monitored through the router: with a 'monitor_port', each worker has its own
+    'MonitorServer', on 'monitor_port' + 1 + its index, for its sessions and metrics"""
+
+    name = "Router"
+
+    # Seconds for workers to start listening, and to close before they are terminated
+    start_timeout = 60
+    stop_timeout = 30
+
+    def __init__(self, server_address, n_workers, monitor_port=0):
+
+        self.server_address = server_address
+        self.worker_ports = [server_address[1] + 1 + i for i in range(n_workers)]
+        self.monitor_ports = [monitor_port + 1 + i if monitor_port else 0 for i in range(n_workers)]
+
+        if set(self.monitor_ports) & set(self.worker_ports + [server_address[1]]):
+            raise ValueError("Monitoring ports {} overlap the ports of the router and workers {}.".format(
+                self.monitor_ports, [server_address[1]] + self.worker_ports))
+        self.ring = HashRing(range(n_workers))
+
+        self.workers = []
+        self.stop = Event()
+        self.loop = None
+        self.server = None
+
+    def run(self):
+
+        self.start_workers()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(self.server_address)
+        sock.listen(1024)
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle_connection, sock=sock))
+
+        self.log("Forwarding {} to workers on ports {}.".format(self.server_address, self.worker_ports))
+
+        if any(self.monitor_ports):
+            self.log("Workers are monitored on ports {}.".format(self.monitor_ports))
+
+        try:
+            self.loop.run_forever()
+
+        finally:
+            self.server.close()
+
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+            self.loop.close()
+            self.stop_workers()
+
+    def shutdown(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # ------------------------------- workers --------------------------------------------- #
+
+    def start_workers(self):
+
+        # Not daemonic: a worker starts the process computing its figures, they are stopped by 'stop_workers'
+        for i, port in enumerate(self.worker_ports):
+            worker = Process(target=run_worker, args=(port, i == 0, self.stop, self.monitor_ports[i]))
+            worker.start()
+            self.workers.append(worker)
+
+        deadline = time.time() + self.start_timeout
+
+        for port in self.worker_ports:
+            while True:
+                try:
+                    socket.create_connection(("localhost", port)).close()
+                    break
+
+                except OSError:
+                    if time.time() > deadline:
+                        self.stop_workers()
+                        raise
+                    time.sleep(0.1)
+
+    def stop_workers(self):
+
+        self.stop.set()
+        deadline = time.time() + self.stop_timeout
+
+        for worker in self.workers:
+            worker.join(max(0, deadline - time.time()))
+
+            if worker.is_alive():
+                self.log("Worker {} did not close in time, terminate it.".format(worker.pid))
+                worker.terminate()
+                worker.join()
+
+    def worker_of(self, target):
+
+        session_id, _ = split_session_id(target)
+        return 0 if session_id is None else self.ring.get(session_id)
+
+    # ------------------------------- forwarding ------------------------------------------ #
+
+    async def handle_connection(self, reader, writer):
+
+        # One connection per worker, kept open along with the client one
+        upstreams = {}
+
+        try:
+            while True:
+
+                request = await AsyncGamingServer.read_request(reader)
+
+                if request is None:
+                    break
+
+                method, target, body, keep_alive = request
+                worker = self.worker_of(target)
+
+                if AsyncGamingServer.is_subscription(target):
+                    await self.forward_stream(worker, method, target, writer)
+                    break
+
+                status, response = await self.forward_to(upstreams, worker, method, target, body)
+
+                AsyncGamingServer.write_response(writer, status, response, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        except Exception as err:
+            self.log("Error while forwarding: '{}'.".format(err))
+
+        finally:
+            for upstream_reader, upstream_writer in upstreams.values():
+                upstream_writer.close()
+            writer.close()
+
+    async def forward_to(self, upstreams, worker, method, target, body):
+        """returns (status, response), over the connection to the worker kept in 'upstreams' if any.
+        The worker may have closed a kept connection meanwhile: the request is then sent once more,
+        over a new connection"""
+
+        for attempt in range(2):
+
+            kept = worker in upstreams
+
+            if not kept:
+                upstreams[worker] = await asyncio.open_connection("localhost", self.worker_ports[worker])
+
+            try:
+                status, response, upstream_open = await self.forward(upstreams[worker], method, target, body)
+
+            except ConnectionError:
+                upstreams.pop(worker)[1].close()
+
+                if not kept or attempt:
+                    raise
+
+                continue
+
+            if not upstream_open:
+                upstreams.pop(worker)[1].close()
+
+            return status, response
+
+    @staticmethod
+    async def forward(upstream, method, target, body):
+        """returns (status, response, whether the worker keeps the connection open)"""
+
+        reader, writer = upstream
+
+        body = body.encode()
+        writer.write(
+            "{} {} HTTP/1.1\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: keep-alive\r\n\r\n".format(method, target, len(body)).encode() + body)
+        await writer.drain()
+
+        status_line = await reader.readline()
+
+        # Nothing was read: the worker had closed the connection
+        if not status_line:
+            raise ConnectionResetError("Worker closed the connection.")
+
+        status = int(status_line.split()[1])
+
+        content_length = None
+        keep_alive = True
+
+        while True:
+            line = await reader.readline()
+
+            if line in (b"\r\n", b"\n", b""):
+                break
+
+            key, _, value = line.decode("latin-1").partition(":")
+
+            if key.strip().lower() == "content-length":
+                content_length = int(value)
+
+            elif key.strip().lower() == "connection":
+                keep_alive = value.strip().lower() == "keep-alive"
+
+        # HTTP/1.0 front-ends ('tcp') close the connection after the body
+        if content_length is None:
+            return status, (await reader.read()).decode(), False
+
+        return status, (await reader.readexactly(content_length)).decode(), keep_alive
+
+    async def forward_stream(self, worker, method, target, writer):
+        """server-sent events are copied as they come"""
+
+        reader, upstream_writer = await asyncio.open_connection("localhost", self.worker_ports[worker])
+
+        try:
+            upstream_writer.write("{} {} HTTP/1.1\r\n\r\n".format(method, target).encode())
+            await upstream_writer.drain()
+
+            while True:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+        finally:
+            upstream_writer.close()
@@ -1,41 +1,30 @@
 import socketserver
 import http.server
-from multiprocessing import Queue, Event
+from concurrent.futures import Future
+from multiprocessing import Event
+from queue import Queue
 from threading import Thread
+from urllib.parse import parse_qs
 import time
 
 from utils.utils import Logger
+from hotelling_server.control.async_server import AsyncGamingServer
+from hotelling_server.control.game import Game
+from hotelling_server.control.session import split_session_id
 
 
 class HttpHandler(http.server.SimpleHTTPRequestHandler, Logger):
 
     def do_GET(self):
 
-        data = self.path
+        self.respond(self.server.parent.handle_request_data(self.path, self.client_address[0]))
 
-        if data:
-
-            try:
-                self.server.controller_queue.put(("server_request", data))
-                controller_response = self.server.server_queue.get()
-
-                if controller_response[0] == "reply":
-                    response = controller_response[1]
-
-                else:
-                    response = "Probably no game is running or trying to shutting down."
-
-            except Exception as e:
-                response = "Server encountered an exception handling request '{}': '''{}'''.". format(data, e)
+    def do_POST(self):
 
-        else:
-            response = "Request is empty."
-        try:
-            self.server.parent.check_client_connection(self.client_address[0], response)
-        except Exception as err:
-            self.log("Error during connection checking: {}".format(err))
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        self.respond(self.server.parent.handle_request_data(self.path, self.client_address[0], body))
 
-        self.log("Reply '{}' to '{}'.".format(response, data))
+    def respond(self, response):
 
         # Send response status code
         self.send_response(200)
@@ -68,6 +57,15 @@ class Server(Thread, Logger):
 
     name = "Server"
 
+    front_ends = {
+        "tcp": TCPGamingServer,
+        "asyncio": AsyncGamingServer
+    }
+
+    # Game replies meaning 'ask again later', long-polled requests are parked on them
+    waiting_replies = ("error/wait", "error/wait_init", "error/time_is_superior")
+    max_long_poll = 60
+
     def __init__(self, controller):
 
         Thread.__init__(self)
@@ -106,7 +104,9 @@ class Server(Thread, Logger):
 
                 self.log("Try to connect using ip {}...".format(ip_address))
 
-                self.tcp_server = TCPGamingServer(
+                front_end = self.front_ends[self.param.get("front_end", "tcp")]
+
+                self.tcp_server = front_end(
                     parent=self,
                     server_address=(ip_address, self.param["port"]),
                     cont=self.cont,
@@ -127,18 +127,113 @@ class Server(Thread, Logger):
             self.tcp_server.shutdown()
             self.log("Shutdown.")
 
+    def submit_request(self, data):
+        """hand a request to the controller, the returned future will hold the reply"""
+
+        reply = Future()
+
+        # Nothing reads the queue of a closed controller, see 'Controller.refuse_requests'
+        if self.shutdown_event.is_set():
+            reply.set_result("error/server_closed")
+            return reply
+
+        self.controller_queue.put(("server_request", data, reply))
+        return reply
+
+    def complete_request(self, data, ip, reply):
+        """build the response to a request once its reply is known"""
+
+        if data:
+
+            try:
+                response = reply.result()
+
+            except Exception as e:
+                response = "Server encountered an exception handling request '{}': '''{}'''.". format(data, e)
+
+        else:
+            response = "Request is empty."
+        try:
+            self.check_client_connection(ip, response, split_session_id(data)[0])
+        except Exception as err:
+            self.log("Error during connection checking: {}".format(err))
+
+        self.log("Reply '{}' to '{}'.".format(response, data))
+
+        return response
+
+    def parse_target(self, target, body=""):
+        """split '/command/arg?long_poll=10' in ('/command/arg', 10).
+        A body holds one command per line: '/batch' with 'ask_a/0\\nask_b/0' gives '/batch/ask_a/0;ask_b/0'"""
+
+        path, _, query = target.partition("?")
+
+        commands = [line.strip("/ \r") for line in body.split("\n") if line.strip("/ \r")]
+        if commands:
+            path = path.rstrip("/") + "/" + Game.batch_separator.join(commands)
+
+        long_poll = parse_qs(query).get("long_poll", ["0"])[0]
+        long_poll = min(float(long_poll), self.max_long_poll) if long_poll.replace(".", "", 1).isdigit() else 0
+
+        return path, long_poll
+
+    def session_of(self, data):
+        """session a request is for (the controller for the default one), if this session already exists"""
+
+        session_id, _ = split_session_id(data)
+
+        return self.cont if session_id is None else getattr(self.cont, "sessions", {}).get(session_id)
+
+    def session_time_manager(self, data):
+        """time manager of the session a request is for, if this session already exists"""
+
+        return getattr(self.session_of(data), "time_manager", None)
+
+    @staticmethod
+    def state_message(session, state, t):
+        """'push/<state>/<t>/<position_0>/<position_1>/<price_0>/<price_1>', sent to the subscribers of a session"""
+
+        current_state = session.data.current_state
+        choices = list(current_state["firm_positions"]) + list(current_state["firm_prices"])
+
+        return "push/" + "/".join([state, str(t)] + [str(int(i)) for i in choices])
+
+    def is_waiting(self, reply):
+        """the reply, or the last reply of a batch, means 'ask again later'"""
+
+        return reply.done() and reply.exception() is None and \
+            str(reply.result()).split("\n")[-1] in self.waiting_replies
+
+    @staticmethod
+    def answered_in_part(reply):
+        """a batch got replies before the waiting one it stopped on"""
+
+        return "\n" in str(reply.result())
+
+    def handle_request_data(self, data, ip, body=""):
+        """forward a request path to the controller and wait for the reply,
+        long polling is left to front-ends able to park requests"""
+
+        data, long_poll = self.parse_target(data, body)
+
+        reply = self.submit_request(data) if data else None
+        return self.complete_request(data, ip, reply)
+
     def end(self):
         self.shutdown_event.set()
         self.queue.put("break")
 
-    def check_client_connection(self, ip, response):
+    def check_client_connection(self, ip, response, session_id=None):
 
+        # Entries are replaced rather than modified: monitors read a copy without lock
         if ip not in self.clients.keys() and "reply_init" in response:
-            self.clients[ip] = {}
-            self.clients[ip]["time"] = time.time()
-            self.clients[ip]["game_id"] = int(response.split("/")[2])
+            self.clients[ip] = {
+                "time": time.time(),
+                "game_id": int(response.split("/")[2]),
+                "session_id": session_id
+            }
         else:
-            self.clients[ip]["time"] = time.time()
+            self.clients[ip] = dict(self.clients[ip], time=time.time())
 
     def check_all_client_time_since_last_request(self):
 
@@ -153,21 +248,30 @@ class Server(Thread, Logger):
     def update_client_time_on_interface(self, ip, time_diff):
 
         game_id = self.clients[ip]["game_id"]
-        role = self.cont.data.roles[game_id]
+        session = self.cont.get_session(self.clients[ip]["session_id"])
+
+        # Clients of a closed session are not shown any more
+        if session is None:
+            return
+
+        data = session.data
+
+        role = data.roles[game_id]
         role_id = None
 
         if role == "customer":
-            if game_id in self.cont.data.customers_id.keys():
-                role_id = self.cont.data.customers_id[game_id]
+            if game_id in data.customers_id.keys():
+                role_id = data.customers_id[game_id]
 
         elif role == "firm":
-            if game_id in self.cont.data.firms_id.keys():
-                role_id = self.cont.data.firms_id[game_id]
+            if game_id in data.firms_id.keys():
+                role_id = data.firms_id[game_id]
         if role_id is not None:
-            self.update_time(role=role, role_id=role_id, time_diff=time_diff)
+            self.update_time(data=data, role=role, role_id=role_id, time_diff=time_diff)
 
-    def update_time(self, role, role_id, time_diff):
-        self.cont.data.current_state["time_since_last_request_{}s".format(role)][role_id] = str(time_diff)
+    @staticmethod
+    def update_time(data, role, role_id, time_diff):
+        data.current_state["time_since_last_request_{}s".format(role)][role_id] = str(time_diff)
 
 
 class Timer(Thread):
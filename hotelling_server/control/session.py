@@ -0,0 +1,138 @@
+import re
+
+from utils.utils import Logger, CommandRouter
+from hotelling_server.control import backup, data, game, statistician, id_manager, time_manager, live_state
+
+
+# Requests for a session other than the controller's own one start with '/session/<session_id>/'
+session_prefix = "/session/"
+
+# Session ids end up in the names of backup files and shared memory blocks
+session_id_pattern = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def split_session_id(request):
+    """'/session/a/ask_init/x' gives ('a', '/ask_init/x'), '/ask_init/x' gives (None, '/ask_init/x')"""
+
+    if not request.startswith(session_prefix):
+        return None, request
+
+    session_id, _, request = request[len(session_prefix):].partition("/")
+    return session_id, "/" + request
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and session_id_pattern.fullmatch(session_id) is not None
+
+
+class SessionQueue:
+    """stands for the controller queue in the components of a session:
+    their messages are tagged with the session id"""
+
+    def __init__(self, queue, session_id):
+        self.queue = queue
+        self.session_id = session_id
+
+    def put(self, message):
+        self.queue.put(("session_message", self.session_id, message))
+
+
+class Session(Logger):
+    """a market hosted next to the controller's own one. It owns its game, time manager, data,
+    statistician and backup file, and stands for the controller of these components"""
+
+    name = "Session"
+
+    # Messages put on the queue by the components of the session, arguments are passed as they are
+    messages = dict.fromkeys((
+        "time_manager_stop_game",
+    ))
+
+    def __init__(self, controller, session_id):
+
+        if not valid_session_id(session_id):
+            raise ValueError("Invalid session id '{}'.".format(session_id))
+
+        self.parent = controller
+        self.session_id = session_id
+
+        # Shared with the controller
+        self.queue = SessionQueue(controller.queue, session_id)
+        self.server = controller.server
+        self.running_game = controller.running_game
+        self.metrics = controller.metrics
+
+        self.data = data.Data(controller=self)
+
+        # Android ids are mapped the same way whatever the session
+        self.data.param = controller.data.param
+
+        self.time_manager = time_manager.TimeManager(controller=self)
+        self.id_manager = id_manager.IDManager(controller=self)
+        self.backup = backup.Backup(controller=self)
+        self.statistician = statistician.RemoteStatistician(controller=self, process=controller.statistics)
+        self.live_state = live_state.LiveState(controller=self)
+        self.game = game.Game(controller=self)
+
+        if controller.replication is not None:
+            controller.replication.add(self.backup)
+
+        self.message_router = CommandRouter(self, self.messages)
+
+    def run_game(self, interface_parameters):
+        self.log("Session '{}': run game.".format(self.session_id))
+        self.data.new()
+        self.time_manager.setup()
+        self.game.new(interface_parameters)
+
+    def load_game(self, file):
+        self.log("Session '{}': load game.".format(self.session_id))
+
+        if not self.data.load(file):
+            self.log("Session '{}': could not load {}.".format(self.session_id, file))
+            return
+
+        self.time_manager.resume()
+        self.game.load()
+
+    def resume_game(self, data):
+        self.log("Session '{}': resume game.".format(self.session_id))
+        self.data.restore(data)
+        self.time_manager.resume()
+        self.game.load()
+
+    def close(self):
+        """bots stop, saves still waiting go to disk, the live state and the figures are removed"""
+
+        # Bots save from their thread
+        if self.game.bots is not None:
+            self.game.stop_bots()
+            self.game.bots.join()
+
+        self.backup.close()
+        self.live_state.close()
+        self.statistician.close()
+
+        if self.parent.replication is not None:
+            self.parent.replication.remove(self.backup)
+
+    def handle_message(self, message):
+
+        try:
+            command, args = self.message_router.resolve(message[0], message[1:])
+
+        except ValueError as err:
+            self.log("Session '{}': {}".format(self.session_id, err))
+            return
+
+        command(*args)
+
+    # ------------------------------ Time Manager interface ------------------------------------ #
+
+    def time_manager_stop_game(self):
+        self.log("Session '{}': 'TimeManager' asks 'stop game'.".format(self.session_id))
+        self.parent.close_session(self.session_id)
+
+    def get_parameters(self, key):
+
+        return self.data.param[key]
@@ -0,0 +1,246 @@
+import numpy as np
+
+
+class Codes:
+    """strings out of a known set, stored as their index in it"""
+
+    dtype = np.dtype("uint8")
+
+    def __init__(self, labels):
+
+        self.labels = labels
+        self.index = {label: code for code, label in enumerate(labels)}
+
+        # Type of the strings once decoded
+        self.value_dtype = "U{}".format(max(len(label) for label in labels))
+
+    def encode(self, value):
+        return self.index[value]
+
+    def decode(self, code):
+        return self.labels[code]
+
+
+class Seconds:
+    """seconds since the last request of a client, or one of 'labels', stored as a negative number"""
+
+    dtype = np.dtype("int32")
+    value_dtype = "U16"
+
+    # No request yet, local bot
+    labels = ("", " ✔ ")
+
+    def encode(self, value):
+        return -1 - self.labels.index(value) if value in self.labels else int(value)
+
+    def decode(self, code):
+        return self.labels[-1 - code] if code < 0 else str(code)
+
+
+class CodedColumn:
+    """list of the values of an entry stored as codes: values are encoded and decoded on the fly"""
+
+    def __init__(self, codes, codec):
+        self.codes = codes
+        self.codec = codec
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return (self.codec.decode(code) for code in self.codes)
+
+    def __getitem__(self, i):
+
+        if isinstance(i, slice):
+            return [self.codec.decode(code) for code in self.codes[i]]
+
+        return self.codec.decode(self.codes[i])
+
+    def __setitem__(self, i, value):
+
+        if isinstance(i, slice):
+            self.codes[i] = [self.codec.encode(v) for v in value]
+
+        else:
+            self.codes[i] = self.codec.encode(value)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(list(self), dtype=dtype or self.codec.value_dtype)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class State:
+    """current state of a game, read and written as a dict. All entries live in one block of
+    memory, 'buffer': numbers as typed arrays (numpy views on the block, written in place),
+    strings as codes, booleans as bit flags. Copying the state copies the block"""
+
+    # entry: (dtype, one value per firm or per customer)
+    numbers = {
+        "firm_positions": ("int16", "firms"),
+        "firm_prices": ("int16", "firms"),
+        "firm_profits": ("int32", "firms"),
+        "firm_cumulative_profits": ("int64", "firms"),
+        "n_client": ("int32", "firms"),
+        "customer_firm_choices": ("int8", "customers"),
+        "customer_extra_view_choices": ("int16", "customers"),
+        "customer_utility": ("int32", "customers"),
+        "customer_cumulative_utility": ("int32", "customers"),
+        "customer_replies": ("bool", "customers")
+    }
+
+    # States a client goes through, see 'Game.set_state'
+    agent_states = Codes((
+        "", "init_firms", "init_customers", "ask_customer_firm_choices", "ask_customer_choice_recording",
+        "ask_firm_passive_opponent_choice", "ask_firm_passive_customer_choices",
+        "ask_firm_active_choice_recording", "ask_firm_active_customer_choices", "end_game"
+    ))
+
+    # entry: (codec, one value per firm or per customer)
+    codes = {
+        "firm_status": (Codes(("active", "passive")), "firms"),
+        "firm_states": (agent_states, "firms"),
+        "customer_states": (agent_states, "customers"),
+        "time_since_last_request_firms": (Seconds(), "firms"),
+        "time_since_last_request_customers": (Seconds(), "customers")
+    }
+
+    # Bits of the 'flags' byte
+    flags = ("active_replied", "passive_gets_results", "active_gets_results", "init_done")
+
+    def __init__(self, n_firms, n_customers, buffer=None):
+
+        self.shape = (n_firms, n_customers)
+        self.layout, size = self.get_layout(n_firms, n_customers)
+
+        self.buffer = np.zeros(size, dtype="uint8") if buffer is None else buffer
+
+        self.arrays = {
+            key: self.buffer[offset:offset + dtype.itemsize * length].view(dtype)
+            for key, (offset, dtype, length) in self.layout.items()
+        }
+
+    @classmethod
+    def get_layout(cls, n_firms, n_customers):
+        """key: (offset, dtype, length) of each array of the block, and the size of the block"""
+
+        n = {"firms": n_firms, "customers": n_customers}
+
+        fields = [(key, np.dtype(dtype), n[agents]) for key, (dtype, agents) in cls.numbers.items()] + \
+            [(key, codec.dtype, n[agents]) for key, (codec, agents) in cls.codes.items()] + \
+            [("flags", np.dtype("uint8"), 1)]
+
+        layout = {}
+        offset = 0
+
+        for key, dtype, length in fields:
+
+            # Aligned on the size of the items
+            offset += -offset % dtype.itemsize
+            layout[key] = (offset, dtype, length)
+            offset += dtype.itemsize * length
+
+        return layout, offset
+
+    @classmethod
+    def value_dtype(cls, key):
+        """type of the values read from an entry"""
+
+        if key in cls.flags:
+            return "bool"
+
+        elif key in cls.codes:
+            return cls.codes[key][0].value_dtype
+
+        return cls.numbers[key][0]
+
+    @classmethod
+    def from_dict(cls, current_state):
+        """current state as it was saved before: a dict of lists and arrays"""
+
+        state = cls(len(current_state["firm_positions"]), len(current_state["customer_firm_choices"]))
+
+        for key in state:
+            if key in current_state:
+                state[key] = current_state[key]
+
+        return state
+
+    # ------------------------------ dict interface -------------------------------------------- #
+
+    def keys(self):
+        return list(self.numbers) + list(self.codes) + list(self.flags)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.numbers or key in self.codes or key in self.flags
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __getitem__(self, key):
+
+        if key in self.flags:
+            return bool(self.arrays["flags"][0] >> self.flags.index(key) & 1)
+
+        elif key in self.codes:
+            return CodedColumn(self.arrays[key], self.codes[key][0])
+
+        return self.arrays[key]
+
+    def __setitem__(self, key, value):
+
+        if key in self.flags:
+            flags = self.arrays["flags"]
+            bit = 1 << self.flags.index(key)
+            flags[0] = flags[0] | bit if value else flags[0] & (0xff ^ bit)
+
+        elif key in self.codes:
+            self[key][:] = value
+
+        else:
+            self.arrays[key][:] = value
+
+    # ------------------------------ copies and changes ---------------------------------------- #
+
+    def copy(self):
+        return State(*self.shape, buffer=self.buffer.copy())
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getstate__(self):
+        return {"shape": self.shape, "buffer": self.buffer.tobytes()}
+
+    def __setstate__(self, state):
+        self.__init__(*state["shape"], buffer=np.frombuffer(bytearray(state["buffer"]), dtype="uint8"))
+
+    def diff(self, other):
+        """bytes of the block that differ from the ones of 'other' (same shape), as (positions, values),
+        None if there are none"""
+
+        positions = np.flatnonzero(self.buffer != other.buffer)
+
+        if not len(positions):
+            return None
+
+        return positions.astype("uint32"), self.buffer[positions]
+
+    def patch(self, changes):
+        """apply changes given by 'diff'"""
+
+        positions, values = changes
+        self.buffer[positions] = values
@@ -1,58 +1,354 @@
+import os
+import pickle
+from multiprocessing import Process, Pipe
+from threading import Thread, Lock
+from types import MappingProxyType
+
 import numpy as np
 from utils.utils import Logger
+from hotelling_server.control.state import State
+
+
+# Figures before the first turn ends
+no_figures = MappingProxyType({})
+
+
+class Running:
+    """mean and variance of all the values pushed so far (Welford), values may be arrays"""
+
+    def __init__(self):
+
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+
+    def push(self, value):
+
+        self.n += 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.n
+        self.m2 = self.m2 + delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / self.n if self.n else 0.
+
+
+class Window:
+    """mean and variance of the last 'size' values pushed, kept in a ring buffer"""
+
+    def __init__(self, size):
+
+        self.size = size
+        self.values = None
+        self.n = 0
+        self.sum = 0.
+        self.sum_of_squares = 0.
+
+    def push(self, value):
+
+        if self.values is None:
+            self.values = np.zeros((self.size, ) + np.shape(value))
+
+        i = self.n % self.size
+
+        # The oldest value leaves the window
+        if self.n >= self.size:
+            self.sum = self.sum - self.values[i]
+            self.sum_of_squares = self.sum_of_squares - self.values[i] ** 2
+
+        self.values[i] = value
+        self.sum = self.sum + value
+        self.sum_of_squares = self.sum_of_squares + value ** 2
+        self.n += 1
+
+    @property
+    def mean(self):
+        return self.sum / min(self.n, self.size) if self.n else 0.
+
+    @property
+    def variance(self):
+        return np.maximum(self.sum_of_squares / min(self.n, self.size) - self.mean ** 2, 0.) if self.n else 0.
+
+
+def frozen(value):
+    """float, or tuple of floats for the values of several agents"""
+
+    value = np.asarray(value, dtype=float)
+
+    return float(value) if value.ndim == 0 else tuple(value.tolist())
 
 
 class Statistician(Logger):
+    """figures of the game, updated at the end of each turn in a time independent of the number of
+    turns played. 'data' is the snapshot of the last turn: a read-only mapping of the figures of
+    the turn, and of their 'running' (whole game) and 'rolling' (last 'window' turns) mean and
+    variance. A new snapshot replaces it each turn, so it can be read at any time without copy"""
+
+    name = "Statistician"
+
+    # Entries the figures are computed from
+    entries = (
+        "firm_positions", "firm_prices", "firm_profits", "firm_cumulative_profits", "n_client",
+        "customer_extra_view_choices", "customer_utility")
+
+    # Turns of the rolling figures
+    window = 10
 
     def __init__(self, controller):
 
         self.controller = controller
-        self.data = {}
-        self.pos = [[], []]
-        self.profits = [[], []]
-        self.cumulative_profits = [[], []]
-        self.mean_extra_view_choices = []
-        self.mean_utility = []
 
-    def compute_distance(self):
+        self.t = 0
+        self.running = {}
+        self.rolling = {}
+
+        self.data = no_figures
+
+    @classmethod
+    def series(cls, history):
+        """figures of each turn of a game played, as they were computed during the game: for each
+        figure, an array holding a row per turn"""
+
+        statistician = cls(controller=None)
+        series = {}
+
+        for t in range(len(history)):
+            figures = statistician.compute_figures({key: history[key][t] for key in cls.entries})
+
+            for key, value in figures.items():
+                series.setdefault(key, []).append(value)
+
+        return {key: np.asarray(value, dtype=float) for key, value in series.items()}
+
+    def compute_figures(self, state=None):
+        """'state': values of the entries at the end of a turn, the current state by default.
+        Returns the figures of the turn"""
+
+        if state is None:
+            state = self.controller.data.current_state
+
+        figures = {}
+
+        self.compute_distance(state, figures)
+        self.compute_prices(state, figures)
+        self.compute_profits(state, figures)
+        self.compute_market_shares(state, figures)
+        self.compute_mean_extra_view_choices(state, figures)
+        self.compute_mean_utility(state, figures)
+
+        for key, value in figures.items():
+
+            if key not in self.running:
+                self.running[key] = Running()
+                self.rolling[key] = Window(self.window)
+
+            self.running[key].push(value)
+            self.rolling[key].push(value)
+
+        self.data = MappingProxyType(dict(
+            {key: frozen(value) for key, value in figures.items()},
+            t=self.t,
+            running=MappingProxyType(
+                {key: (frozen(s.mean), frozen(s.variance)) for key, s in self.running.items()}),
+            rolling=MappingProxyType(
+                {key: (frozen(s.mean), frozen(s.variance)) for key, s in self.rolling.items()})
+        ))
+
+        self.t += 1
+
+        return figures
+
+    @staticmethod
+    def compute_distance(state, figures):
 
-        pos = self.controller.data.current_state["firm_positions"]
+        positions = np.asarray(state["firm_positions"], dtype=float)
 
-        for i in range(len(self.pos)):
-            self.pos[i].append(pos[i])
+        figures["firm_positions"] = positions
+        figures["firm_distance"] = np.abs(positions[0] - positions[-1])
 
-        self.data["firm_distance"] = self.pos
+    @staticmethod
+    def compute_prices(state, figures):
 
-    def compute_mean_extra_view_choices(self):
+        prices = np.asarray(state["firm_prices"], dtype=float)
 
-        mean = np.mean(self.controller.data.current_state["customer_extra_view_choices"])
+        figures["firm_prices"] = prices
+        figures["mean_price"] = np.mean(prices)
+        figures["price_dispersion"] = np.std(prices)
 
-        self.mean_extra_view_choices.append(mean)
+    @staticmethod
+    def compute_profits(state, figures):
 
-        self.data["customer_mean_extra_view_choices"] = self.mean_extra_view_choices
+        figures["firm_profits"] = np.asarray(state["firm_profits"], dtype=float)
+        figures["firm_cumulative_profits"] = np.asarray(state["firm_cumulative_profits"], dtype=float)
 
-    def compute_cumulative_profits(self):
+    @staticmethod
+    def compute_market_shares(state, figures):
+        """shares of the customers served, and their Herfindahl index"""
 
-        profits = self.controller.data.current_state["firm_cumulative_profits"]
+        n_client = np.asarray(state["n_client"], dtype=float)
+        served = np.sum(n_client)
+        shares = n_client / served if served else np.zeros(len(n_client))
 
-        for i in range(len(self.profits)):
-            self.cumulative_profits[i].append(profits[i])
+        figures["market_shares"] = shares
+        figures["herfindahl"] = np.sum(shares ** 2)
 
-        self.data["firm_cumulative_profits"] = self.cumulative_profits
+    @staticmethod
+    def compute_mean_extra_view_choices(state, figures):
+        figures["customer_mean_extra_view_choices"] = np.mean(state["customer_extra_view_choices"])
 
-    def compute_profits(self):
+    @staticmethod
+    def compute_mean_utility(state, figures):
+        figures["customer_mean_utility"] = np.mean(state["customer_utility"])
 
-        profits = self.controller.data.current_state["firm_profits"]
 
-        for i in range(len(self.profits)):
-            self.profits[i].append(profits[i])
+def serve(connection, server_end):
+    """loop of the statistics process: the current state of a session at the end of a turn comes
+    in (its buffer, see 'State'), the pickled snapshot of its figures goes out. A closed session
+    comes in without state: its figures are dropped, None goes out"""
 
-        self.data["firm_profits"] = self.profits
+    # Only open in the server process: its end closes if it stops
+    server_end.close()
 
-    def compute_mean_utility(self):
+    # Requests come first when the CPUs are busy
+    os.nice(10)
+
+    statisticians = {}
+
+    while True:
+
+        # The server process may stop without saying so
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            break
+
+        if message is None:
+            break
+
+        session_id, shape, buffer = message
+
+        if shape is None:
+            statisticians.pop(session_id, None)
+            connection.send((session_id, None))
+            continue
+
+        if session_id not in statisticians:
+            statisticians[session_id] = Statistician(controller=None)
+
+        statistician = statisticians[session_id]
+        statistician.compute_figures(State(*shape, buffer=np.frombuffer(buffer, dtype="uint8")))
+
+        data = dict(statistician.data, running=dict(statistician.data["running"]),
+                    rolling=dict(statistician.data["rolling"]))
+        connection.send((session_id, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+
+
+class StatisticsProcess(Logger):
+    """process computing the figures of every session of a controller, see 'RemoteStatistician'.
+    Ending a turn only sends the bytes of the current state through a pipe: the figures do not
+    take the time of the requests, whatever their number"""
+
+    name = "StatisticsProcess"
+
+    def __init__(self):
+
+        self.connection, worker = Pipe()
+
+        # Started before the threads of the server
+        self.process = Process(target=serve, args=(worker, self.connection), daemon=True)
+        self.process.start()
+        worker.close()
+
+        # key: session_id, value: snapshot of the last turn, see 'Statistician'
+        self.snapshots = {}
+
+        # Snapshots received but not read yet, pickled
+        self.received = {}
+
+        # Turns of several sessions end in several threads
+        self.lock = Lock()
+
+        self.receiver = Thread(target=self.receive, daemon=True)
+        self.receiver.start()
+
+    def publish(self, session_id, state):
+
+        with self.lock:
+            try:
+                self.connection.send((session_id, state.shape, state.buffer.tobytes()))
+
+            except (OSError, ValueError):
+                self.log("Figures of session '{}' are lost: the process stopped.".format(session_id))
+
+    def forget(self, session_id):
+        """drop the figures of a closed session, once the ones being computed are received"""
+
+        with self.lock:
+            try:
+                self.connection.send((session_id, None, None))
+
+            except (OSError, ValueError):
+                pass
+
+    def receive(self):
+
+        while True:
+            try:
+                session_id, data = self.connection.recv()
+
+            except (EOFError, OSError):
+                break
+
+            if data is None:
+                self.received.pop(session_id, None)
+                self.snapshots.pop(session_id, None)
+
+            else:
+                self.received[session_id] = data
+
+    def snapshot(self, session_id):
+        """unpickled the first time it is read"""
+
+        data = self.received.pop(session_id, None)
+
+        if data is not None:
+            data = pickle.loads(data)
+            self.snapshots[session_id] = MappingProxyType(dict(
+                data, running=MappingProxyType(data["running"]), rolling=MappingProxyType(data["rolling"])))
+
+        return self.snapshots.get(session_id, no_figures)
+
+    def close(self):
+
+        with self.lock:
+            try:
+                self.connection.send(None)
+
+            except (OSError, ValueError):
+                pass
+
+        self.process.join(1)
+
+
+class RemoteStatistician(Logger):
+    """statistician of a session, computing in a 'StatisticsProcess'. 'data' is the snapshot of
+    the figures of the last turn, as 'Statistician.data', once the process computed them"""
+
+    name = "RemoteStatistician"
+
+    def __init__(self, controller, process):
+
+        self.controller = controller
+        self.process = process
+        self.session_id = getattr(controller, "session_id", None)
 
-        mean = np.mean(self.controller.data.current_state["customer_utility"])
+    @property
+    def data(self):
+        return self.process.snapshot(self.session_id)
 
-        self.mean_utility.append(mean)
+    def compute_figures(self):
+        self.process.publish(self.session_id, self.controller.data.current_state)
 
-        self.data["customer_mean_utility"] = self.mean_utility
+    def close(self):
+        self.process.forget(self.session_id)
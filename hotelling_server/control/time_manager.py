@@ -1,6 +1,9 @@
+import time
+
 import numpy as np
 
 from utils.utils import Logger
+from hotelling_server.control import metrics
 
 
 class TimeManager(Logger):
@@ -13,50 +16,83 @@ class TimeManager(Logger):
         self.ending_t = None
         self.continue_game = True
 
+        # Incremented at each state change, listeners are called with (state, t)
+        self.state_version = 0
+        self.state_listeners = []
+
+        # Time spent in each state, from the time it was entered
+        self.state_time = time.perf_counter()
+        self.session = metrics.session_label(controller)
+        self.state_duration = controller.metrics.histogram(
+            "hotelling_time_manager_state_duration_seconds", "Time spent in each state of the time manager.",
+            ("session", "state"), buckets=metrics.state_buckets)
+        self.turns = controller.metrics.counter("hotelling_turns_total", "Turns played.", ("session", ))
+
     def setup(self):
         
-        self.state = self.data.time_manager_state
-
-        self.log("NEW STATE: {}.".format(self.state))
+        self.change_state(self.data.time_manager_state)
 
         self.t = self.data.time_manager_t
         self.ending_t = None
         self.continue_game = True
         self.beginning_time_step()
 
+    def resume(self):
+        """after a load: the state, turn and ending of the game saved, the current turn goes on
+        from where it was"""
+
+        self.t = self.data.time_manager_t
+        self.ending_t = self.data.time_manager_ending_t
+        self.continue_game = self.data.continue_game
+        self.change_state(self.data.time_manager_state)
+
+        # The last request may have met the conditions of the next state without being saved after
+        self.check_state()
+
     def check_state(self):
         
         # Time to init
         if self.state == "beginning_init":
             if self.data.current_state["init_done"]:
-                self.state = "beginning_time_step"
-                self.log("NEW STATE: {}.".format(self.state))
+                self.change_state("beginning_time_step")
         
         # Active firm must play
         elif self.state == "beginning_time_step":
             if self.data.current_state["active_replied"]:
-                self.state = "active_has_played"
-                self.log("NEW STATE: {}.".format(self.state))
+                self.change_state("active_has_played")
         
         # Then customers need to choose a perimeter as well as a firm to buy from
         elif self.state == "active_has_played":
             if np.sum(self.data.current_state["customer_replies"]) == self.data.param["game"]["n_customers"]:
-                self.state += "_and_all_customers_replied"
-                self.log("NEW STATE: {}.".format(self.state))
+                self.change_state(self.state + "_and_all_customers_replied")
 
         # Firms need to know their respective scores, then it is the end of the turn
         elif self.state == "active_has_played_and_all_customers_replied":
             if self.data.current_state["passive_gets_results"] and self.data.current_state["active_gets_results"]:
 
-                self.state = "end_time_step"
-                self.log("NEW STATE: {}.".format(self.state))
+                self.change_state("end_time_step")
                 self.end_time_step()
                 
                 # If the game did not end
                 if self.state != "end_game":
                     self.beginning_time_step()
-                    self.state = "beginning_time_step"
-                    self.log("NEW STATE: {}.".format(self.state))
+                    self.change_state("beginning_time_step")
+
+    def change_state(self, state):
+
+        now = time.perf_counter()
+
+        if self.state:
+            self.state_duration.labels(self.session, self.state).observe(now - self.state_time)
+
+        self.state_time = now
+        self.state = state
+        self.state_version += 1
+        self.log("NEW STATE: {}.".format(self.state))
+
+        # Copy: listeners come and go from other threads
+        for listener in list(self.state_listeners):
+            listener(self.state, self.t)
 
     def beginning_time_step(self):
         
@@ -76,9 +112,10 @@ class TimeManager(Logger):
         # Reverse firm status (passive/active)
         self.data.current_state["firm_status"] = self.data.current_state["firm_status"][::-1]
         
-        # Compute figures in order to show them in game view
-        self.controller.queue.put(("time_manager_compute_figures", ))
+        # Compute figures in order to show them in game view (in another process: this only sends the values)
+        self.controller.statistician.compute_figures()
         self.t += 1
+        self.turns.labels(self.session).inc()
         
         # The game is going to stop, it's time to declare ending time
         if not self.continue_game and not self.ending_t:
@@ -88,7 +125,7 @@ class TimeManager(Logger):
         # Ending time is defined and all clients got it (if it's works correctly)
         elif not self.continue_game and self.ending_t:
             self.log("GAME ENDS NOW.")
-            self.state = "end_game"
+            self.change_state("end_game")
             self.controller.queue.put(("time_manager_stop_game", ))
 
     def stop_as_soon_as_possible(self):
@@ -1,20 +1,45 @@
-from multiprocessing import Queue, Event
+from multiprocessing import Event
+from queue import Queue, Empty
 from threading import Thread
 
-from utils.utils import Logger
-from hotelling_server.control import backup, data, game, server, statistician, id_manager, time_manager
+from utils.utils import Logger, CommandRouter
+from hotelling_server.control import backup, data, game, server, statistician, id_manager, time_manager, live_state, \
+    metrics
+from hotelling_server.control.replication import ReplicationServer
+from hotelling_server.control.monitor import MonitorServer
+from hotelling_server.control.session import Session, split_session_id, valid_session_id
 
 
 class Controller(Thread, Logger):
 
     name = "Controller"
 
-    def __init__(self, model):
+    # The controller hosts the default session, the other ones are in 'sessions'
+    session_id = None
+
+    # Messages put on the queue, arguments are passed as they are
+    messages = dict.fromkeys((
+        "launch_game", "close_window", "stop_game", "ui_retry_server", "scan_network_for_new_devices",
+        "server_running", "server_error", "server_request",
+        "run_game", "load_game", "resume_game", "new_session", "load_session", "resume_session",
+        "stop_session", "session_message",
+        "time_manager_stop_game"
+    ))
+
+    # Clients open a session with '/session/<session_id>/new_session', up to 'max_sessions' of them at once:
+    # a session is closed at the end of its game
+    new_session_request = "/new_session"
+    max_sessions = 64
+
+    def __init__(self, model, default_session=True, network=None):
 
         super().__init__()
 
         self.mod = model
 
+        # Workers behind a router only host the default session if they are the first one
+        self.default_session = default_session
+
         # For receiving inputs
         self.queue = Queue()
 
@@ -26,23 +51,72 @@ class Controller(Thread, Logger):
         self.continue_game = Event()
         self.device_scanning_event = Event()
 
+        # Shared with the sessions, see 'MonitorServer'
+        self.metrics = metrics.Registry()
+        self.metrics.gauge("hotelling_controller_queue_depth", "Messages waiting for the controller.") \
+            .labels().set_function(self.queue.qsize)
+
         self.data = data.Data(controller=self)
+
+        # Network parameters of a worker differ from the ones in the file
+        if network is not None:
+            self.data.param["network"] = dict(self.data.param["network"], **network)
+
+        # Data of a game to resume rather than running a new one, see 'Standby'
+        self.replica = None
+
         self.time_manager = time_manager.TimeManager(controller=self)
         self.id_manager = id_manager.IDManager(controller=self)
         self.backup = backup.Backup(controller=self)
-        self.statistician = statistician.Statistician(controller=self)
+        # Figures of every session are computed by another process
+        self.statistics = statistician.StatisticsProcess()
+        self.statistician = statistician.RemoteStatistician(controller=self, process=self.statistics)
+
+        # For monitors in other processes
+        self.live_state = live_state.LiveState(controller=self)
         self.server = server.Server(controller=self)
         self.game = game.Game(controller=self)
 
+        # Session registry, sessions are created by their first request
+        self.sessions = {}
+
+        # Standby processes follow the saves of this one
+        replication_port = self.data.param["network"].get("replication_port", 0)
+        self.replication = ReplicationServer(replication_port) if replication_port else None
+
+        if self.replication is not None:
+            self.replication.add(self.backup)
+
+        # Operators poll sessions apart from the game
+        monitor_port = self.data.param["network"].get("monitor_port", 0)
+        self.monitor = MonitorServer(controller=self, port=monitor_port) if monitor_port else None
+
         # For giving go signal to server
         self.server_queue = self.server.queue
 
+        self.message_router = CommandRouter(self, self.messages)
+
     def run(self):
 
         self.log("Waiting for a message.")
-        
-        self.queue.put(("run_game", self.data.param))
-        self.log("Launching server and game...")
+
+        if self.replication is not None:
+            self.replication.start()
+
+        if self.monitor is not None:
+            self.monitor.start()
+
+        if self.replica is not None:
+            self.queue.put(("resume_game", self.replica))
+            self.log("Resuming game...")
+
+        elif self.default_session:
+            self.queue.put(("run_game", self.data.param))
+            self.log("Launching server and game...")
+
+        else:
+            self.queue.put(("launch_game", ))
+            self.log("Launching server...")
 
         while not self.shutdown.is_set():
             
@@ -51,10 +125,12 @@ class Controller(Thread, Logger):
             self.handle_message(message)
 
         self.close_program()
+        self.refuse_requests()
 
     def launch_game(self):
 
         self.fatal_error.clear()
+        self.device_scanning_event.clear()
         self.continue_game.set()
         self.running_game.set()
 
@@ -82,6 +158,19 @@ class Controller(Thread, Logger):
         self.server_queue.put(("Abort",))
         self.server.shutdown()
         self.server.end()
+
+        if self.monitor is not None:
+            self.monitor.shutdown()
+
+        # Saves still waiting for the disk
+        self.backup.close()
+        self.live_state.close()
+
+        for session in self.sessions.values():
+            session.close()
+
+        self.statistics.close()
+
         self.shutdown.set()
 
     def fatal_error_of_communication(self):
@@ -114,15 +203,24 @@ class Controller(Thread, Logger):
     def handle_message(self, message):
 
         try:
-            command = message[0]
-            args = message[1:]
-            if len(args):
-                eval("self.{}(*args)".format(command))
-            else:
-                eval("self.{}()".format(command))
+            command, args = self.message_router.resolve(message[0], message[1:])
+            command(*args)
 
         except Exception as err:
             print(str(err))
+
+    def refuse_requests(self):
+        """requests left on the queue once closed get an error reply rather than none"""
+
+        while True:
+            try:
+                message = self.queue.get_nowait()
+
+            except Empty:
+                break
+
+            if message[0] == "server_request":
+                message[2].set_result("error/server_closed")
                 
     # ------------------------------ Server interface ----------------------------------------#
 
@@ -136,18 +234,30 @@ class Controller(Thread, Logger):
 
         self.log("Server error.")
 
-    def server_request(self, server_data):
+    def server_request(self, server_data, reply):
         
-        # when using device manager to add new clients to json mapping
+        # No game to answer while scanning for devices, they are mapped by 'IDManager' once it is launched
         if self.device_scanning_event.is_set():
 
-            self.add_device_to_map_android_id_server_id(server_data)
+            self.log("Request '{}' while scanning for devices.".format(server_data))
+            reply.set_result("error/device_scanning")
         
         # When game is launched
         else:
 
-            response = self.game.handle_request(server_data)
-            self.server_queue.put(("reply", response))
+            try:
+                session_id, request = split_session_id(server_data)
+
+                if session_id is not None and request == self.new_session_request:
+                    reply.set_result(self.open_session(session_id))
+                    return
+
+                session = self.get_session(session_id)
+                reply.set_result("error/unknown_session" if session is None else session.game.handle_request(request))
+
+            except Exception as err:
+                reply.set_exception(err)
+                raise
    
     def run_game(self, interface_parameters):
         self.log("UI ask 'run game'.")
@@ -158,11 +268,82 @@ class Controller(Thread, Logger):
 
     def load_game(self, file):
         self.log("UI ask 'load game'.")
-        self.data.load(file)
-        self.time_manager.setup()
+
+        if not self.data.load(file):
+            self.log("Could not load {}.".format(file))
+            return
+
+        self.time_manager.resume()
+        self.launch_game()
+        self.game.load()
+
+    def resume_game(self, data):
+        self.log("Standby takes over: resume game.")
+        self.data.restore(data)
+        self.time_manager.resume()
         self.launch_game()
         self.game.load()
 
+    def new_session(self, session_id, interface_parameters):
+        self.log("New session '{}'.".format(session_id))
+        self.sessions[session_id] = Session(controller=self, session_id=session_id)
+        self.sessions[session_id].run_game(interface_parameters)
+
+    def load_session(self, session_id, file):
+        self.log("Load session '{}'.".format(session_id))
+        self.sessions[session_id] = Session(controller=self, session_id=session_id)
+        self.sessions[session_id].load_game(file)
+
+    def resume_session(self, session_id, data):
+        self.log("Resume session '{}'.".format(session_id))
+        self.sessions[session_id] = Session(controller=self, session_id=session_id)
+        self.sessions[session_id].resume_game(data)
+
+    def stop_session(self, session_id):
+        self.log("Stop session '{}'.".format(session_id))
+
+        session = self.sessions[session_id]
+
+        # A game not started has no turn to end
+        if not session.data.current_state["init_done"]:
+            self.close_session(session_id)
+
+        else:
+            session.time_manager.stop_as_soon_as_possible()
+
+    def close_session(self, session_id):
+        """the game of the session ended: it is closed, and its id may be used again"""
+
+        session = self.sessions.pop(session_id, None)
+
+        if session is not None:
+            self.log("Close session '{}'.".format(session_id))
+            session.close()
+
+    def open_session(self, session_id):
+        """a new session with the parameters of the controller, for a client: returns the reply"""
+
+        if not valid_session_id(session_id):
+            return "error/bad_session_id"
+
+        if session_id not in self.sessions:
+
+            if len(self.sessions) >= self.max_sessions:
+                return "error/too_many_sessions"
+
+            self.new_session(session_id, self.data.param)
+
+        return "reply/new_session/{}".format(session_id)
+
+    def get_session(self, session_id):
+        """the controller itself for the default session, the registered session otherwise (None if there
+        is none, see 'open_session')"""
+
+        if session_id is None:
+            return self
+
+        return self.sessions.get(session_id)
+
     def stop_game(self):
         self.log("User asks to stop game.")
         self.stop_game_first_phase()
@@ -181,30 +362,32 @@ class Controller(Thread, Logger):
         self.log("'TimeManager' asks 'stop game'.")
         self.stop_game_second_phase()
 
-    def time_manager_compute_figures(self):
+    # ------------------------------ Sessions interface ---------------------------------------- #
 
-        self.log("'TimeManager' asks 'compute_figures'")
+    def session_message(self, session_id, message):
 
-        # Needs to be moved elsewhere?
-        self.statistician.compute_distance()
-        self.statistician.compute_mean_extra_view_choices()
-        self.statistician.compute_profits()
-        self.statistician.compute_mean_utility()
+        if session_id in self.sessions:
+            self.sessions[session_id].handle_message(message)
 
     # ---------------------- Parameters management -------------------------------------------- #
 
-    def get_current_data(self):
+    def get_current_data(self, session_id=None):
+
+        session = self.get_session(session_id)
+
+        if session is None:
+            raise ValueError("Unknown session '{}'.".format(session_id))
 
         return {
-            "current_state": self.data.current_state,
-            "bot_firms_id": self.data.bot_firms_id,
-            "firms_id": self.data.firms_id,
-            "bot_customers_id": self.data.bot_customers_id,
-            "customers_id": self.data.customers_id,
-            "roles": self.data.roles,
-            "time_manager_t": self.data.controller.time_manager.t,
-            "statistics": self.statistician.data,
-            "map_server_id_game_id": self.data.map_server_id_game_id
+            "current_state": session.data.current_state,
+            "bot_firms_id": session.data.bot_firms_id,
+            "firms_id": session.data.firms_id,
+            "bot_customers_id": session.data.bot_customers_id,
+            "customers_id": session.data.customers_id,
+            "roles": session.data.roles,
+            "time_manager_t": session.time_manager.t,
+            "statistics": session.statistician.data,
+            "map_server_id_game_id": session.data.map_server_id_game_id
         }
 
     def get_parameters(self, key):
@@ -1,13 +1,40 @@
+import json
+import sys
+
+
 def main():
     
     from hotelling_server.parameters.config_files_manager import ConfigFilesManager
 
     ConfigFilesManager.run()
 
-    from hotelling_server import model
+    with open("hotelling_server/parameters/network.json") as f:
+        network = json.load(f)
+
+    ip_address = "localhost" if network["local"] else network["ip_address"]
+
+    # Follows the saves of the server running, takes over if it stops
+    if "--standby" in sys.argv:
+
+        from hotelling_server.control.replication import Standby
+
+        Standby(port=network["replication_port"], server_address=(ip_address, network["port"])).run()
+
+    # Sessions shared between worker processes behind a router
+    elif network.get("n_workers", 0):
+
+        from hotelling_server.control.router import Router
+
+        Router(
+            server_address=(ip_address, network["port"]), n_workers=network["n_workers"],
+            monitor_port=network.get("monitor_port", 0)).run()
+
+    else:
+
+        from hotelling_server import model
 
-    m = model.Model()
-    m.run()
+        m = model.Model()
+        m.run()
 
 
 if __name__ == "__main__":
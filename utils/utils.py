@@ -1,4 +1,5 @@
 from datetime import datetime
+import functools
 import inspect
 import socket
 import numpy as np
@@ -8,6 +9,56 @@ def function_name():
     return inspect.stack()[1][3]
 
 
+def auto(argument):
+    """digits give an int, anything else is kept as it is"""
+    return int(argument) if argument.isdigit() else argument
+
+
+class CommandRouter:
+    """maps command names to handlers once, with a type per argument.
+    Types are applied to string arguments only: 'resolve("ask_a", ["1", "x"])' gives (self.ask_a, [1, "x"]).
+    A schema ending with '...' applies its last type to any further argument,
+    a schema set to None passes the arguments as they are.
+    With 'pass_name', handlers get the name they are registered under as their first argument"""
+
+    def __init__(self, owner, schema, pass_name=False):
+
+        self.routes = {}
+
+        for name, types in schema.items():
+
+            handler = functools.partial(getattr(owner, name), name) if pass_name else getattr(owner, name)
+
+            if types and types[-1] is Ellipsis:
+                self.routes[name] = (handler, types[:-2], types[-2])
+            else:
+                self.routes[name] = (handler, types, None)
+
+    def __contains__(self, name):
+        return name in self.routes
+
+    def resolve(self, name, args):
+
+        if name not in self.routes:
+            raise ValueError("Unknown command '{}'.".format(name))
+
+        handler, types, rest = self.routes[name]
+
+        if types is None:
+            return handler, args
+
+        if len(args) < len(types) or (rest is None and len(args) > len(types)):
+            raise ValueError("'{}' takes {}{} arguments, got {}.".format(
+                name, "at least " if rest is not None else "", len(types), len(args)))
+
+        converted = [t(a) if isinstance(a, str) else a for t, a in zip(types, args)]
+
+        if rest is not None:
+            converted += [rest(a) if isinstance(a, str) else a for a in args[len(types):]]
+
+        return handler, converted
+
+
 def get_local_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     # ip = '192.0.0.' + str(np.random.randint(99))